@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY AIR SIMULATION
+=========================
+
+Air pressure, velocity and ambient heat on PowderToySimulation's CELL
+resolution grids (vx, vy, pv, hv), in the spirit of TPT's Air class.
+Every stage is a whole-array NumPy operation over the cell grid.
+
+License: GPL-3.0
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from powder_toy_engine import PowderToySimulation
+
+# =============================================================================
+# AIR SOLVER
+# =============================================================================
+
+class AirSolver:
+    """
+    Based on TPT's Air::update_air and Air::update_airh. Per frame:
+
+    - pressure changes by the divergence of the velocity field,
+    - velocity accelerates down the pressure gradient,
+    - hot air rises (convection from hv),
+    - all fields are smoothed and advected semi-Lagrangian style,
+    - the outer edge of the grid is a closed wall.
+
+    vx[y, x] is the flow from cell x to x + 1 and vy[y, x] the flow from
+    row y to y + 1, as in TPT. Velocities are in pixels per frame.
+    """
+
+    # TPT's air constants
+    AIR_TSTEPP = 0.3    # Pressure step
+    AIR_TSTEPV = 0.4    # Velocity step
+    AIR_VADV = 0.3      # Advection blend
+    AIR_VLOSS = 0.999   # Velocity loss per frame
+    AIR_PLOSS = 0.9999  # Pressure loss per frame
+    MAX_PRESSURE = 256.0
+
+    # Ambient heat: hot air rises, and hv slowly returns to room temperature
+    AMBIENT_TEMP = 295.15
+    HEAT_CONVECTION = 0.0001  # Upward velocity per Kelvin above ambient
+    HEAT_LOSS = 0.999
+
+    # Below this velocity (pixels per frame) the air counts as still
+    STILL = 1e-3
+
+    def __init__(self, cell: int):
+        self.cell = cell
+        self._grid = None  # Cached cell coordinates for the advection stencil
+
+    def reset(self, sim: 'PowderToySimulation'):
+        """Still air at room temperature"""
+        sim.vx.fill(0.0)
+        sim.vy.fill(0.0)
+        sim.pv.fill(0.0)
+        sim.hv.fill(self.AMBIENT_TEMP)
+
+    def step(self, sim: 'PowderToySimulation'):
+        """Advance the air grids by one frame, in place"""
+        vx, vy, pv, hv = sim.vx, sim.vy, sim.pv, sim.hv
+
+        # Pressure from the net flow into each cell
+        dp = np.zeros_like(pv)
+        dp[:, 1:] += vx[:, :-1]
+        dp -= vx
+        dp[1:, :] += vy[:-1, :]
+        dp -= vy
+        pv *= self.AIR_PLOSS
+        pv += dp * self.AIR_TSTEPP
+
+        # Velocity from the pressure gradient, plus convection
+        vx *= self.AIR_VLOSS
+        vy *= self.AIR_VLOSS
+        vx[:, :-1] += (pv[:, :-1] - pv[:, 1:]) * self.AIR_TSTEPV
+        vy[:-1, :] += (pv[:-1, :] - pv[1:, :]) * self.AIR_TSTEPV
+        vy -= (hv - self.AMBIENT_TEMP) * self.HEAT_CONVECTION
+
+        # Closed box: nothing flows out through the edges
+        vx[:, -1] = 0.0
+        vy[-1, :] = 0.0
+
+        # Smooth, then carry every field along the (smoothed) flow
+        svx, svy = self._smooth(vx), self._smooth(vy)
+        stencil = self._stencil(svx, svy)
+        blend = self.AIR_VADV
+        vx[:] = svx * (1.0 - blend) + self._sample(svx, stencil) * blend
+        vy[:] = svy * (1.0 - blend) + self._sample(svy, stencil) * blend
+        pv[:] = self._smooth(pv)
+        hv[:] = self._sample(self._smooth(hv), stencil)
+        hv -= (hv - self.AMBIENT_TEMP) * (1.0 - self.HEAT_LOSS)
+
+        np.clip(vx, -self.MAX_PRESSURE, self.MAX_PRESSURE, out=vx)
+        np.clip(vy, -self.MAX_PRESSURE, self.MAX_PRESSURE, out=vy)
+        np.clip(pv, -self.MAX_PRESSURE, self.MAX_PRESSURE, out=pv)
+
+    def is_still(self, sim: 'PowderToySimulation') -> bool:
+        """True when no air moves fast enough to carry particles anywhere"""
+        wind = max(float(np.abs(sim.vx).max()), float(np.abs(sim.vy).max()))
+        return wind < self.STILL
+
+    def _smooth(self, field: np.ndarray) -> np.ndarray:
+        """Separable [1, 2, 1] / 4 blur with clamped edges"""
+        rows = field * 2.0
+        rows[:, 1:] += field[:, :-1]
+        rows[:, 0] += field[:, 0]
+        rows[:, :-1] += field[:, 1:]
+        rows[:, -1] += field[:, -1]
+
+        out = rows * 2.0
+        out[1:, :] += rows[:-1, :]
+        out[0, :] += rows[0, :]
+        out[:-1, :] += rows[1:, :]
+        out[-1, :] += rows[-1, :]
+        out *= 1.0 / 16.0
+        return out
+
+    def _stencil(self, vx: np.ndarray, vy: np.ndarray):
+        """
+        Bilinear sampling stencil at the point each cell's air came from this
+        frame (clamped to the grid): four flat cell indices and their weights.
+        Shared by every field advected along the same flow.
+        """
+        height, width = vx.shape
+        if self._grid is None or self._grid[0].shape != vx.shape:
+            self._grid = np.indices((height, width), dtype=np.float32)
+        ys, xs = self._grid
+
+        sample_x = np.clip(xs - vx / self.cell, 0, width - 1)
+        sample_y = np.clip(ys - vy / self.cell, 0, height - 1)
+        x0 = sample_x.astype(np.int32)
+        y0 = sample_y.astype(np.int32)
+        fx = sample_x - x0
+        fy = sample_y - y0
+
+        i00 = (y0 * width + x0).ravel()
+        i01 = i00 + (x0 < width - 1).ravel()
+        i10 = i00 + width * (y0 < height - 1).ravel()
+        i11 = i10 + (x0 < width - 1).ravel()
+        weights = ((1.0 - fx) * (1.0 - fy), fx * (1.0 - fy), (1.0 - fx) * fy, fx * fy)
+        return (i00, i01, i10, i11), weights
+
+    def _sample(self, field: np.ndarray, stencil) -> np.ndarray:
+        """Interpolate field through a stencil from _stencil"""
+        indices, weights = stencil
+        flat = field.ravel()
+        out = flat.take(indices[0]).reshape(field.shape) * weights[0]
+        for index, weight in zip(indices[1:], weights[1:]):
+            out += flat.take(index).reshape(field.shape) * weight
+        return out
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY BENCHMARKS
+=====================
+
+Headless benchmark suite for PowderToySimulation. Each scene sets up a
+typical workload (an avalanche of sand, a flood, oil on water, burning
+gunpowder, lava on stone, a completely full grid), runs it for a fixed
+number of frames and reports, as JSON:
+
+- steps per second and particle updates per second,
+- peak memory (traced allocations for the scene, and the process's peak RSS),
+- time per step spent in each phase of update_particles.
+
+--check instead runs the correctness checks (scenes whose outcome is
+known, such as a brushed stroke of sand coming to rest), each in the
+storage modes it applies to, and exits with status 1 if any fails.
+
+The report's config also lists the simulation's estimated footprint.
+Scenes scale with the grid; --preset tpt runs them at The Powder Toy's
+612x384 with one particle per pixel.
+
+Usage:
+    python powder_toy_bench.py [--scene NAME ...] [--frames N]
+                               [--storage objects|arrays] [--workers N]
+                               [--preset widget|tpt] [--size WxH] [--npart N]
+                               [--output results.json]
+    python powder_toy_bench.py --check
+
+License: GPL-3.0
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from powder_toy_brush import draw_stroke
+from powder_toy_engine import PowderToySimulation, ElementType
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# =============================================================================
+# SCENES
+# =============================================================================
+
+def fill_rect(sim: PowderToySimulation, x0: int, y0: int, x1: int, y1: int,
+              element_type: int):
+    """Fill the cells x0 <= x < x1, y0 <= y < y1 (fractions of the grid are rounded)"""
+    for y in range(int(y0), int(y1)):
+        for x in range(int(x0), int(x1)):
+            sim.create_particle(x, y, element_type)
+
+def scene_sand_avalanche(sim):
+    """A tall block of sand collapsing onto a stone floor"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, 0, h - 4, w, h, ElementType.PT_STONE)
+    fill_rect(sim, w * 0.1, h * 0.1, w * 0.4, h * 0.7, ElementType.PT_SAND)
+
+def scene_water_flood(sim):
+    """A wall of water released into a stone basin"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, 0, h - 4, w, h, ElementType.PT_STONE)
+    fill_rect(sim, w * 0.6, h * 0.5, w * 0.6 + 4, h - 4, ElementType.PT_STONE)
+    fill_rect(sim, w * 0.05, h * 0.2, w * 0.35, h - 4, ElementType.PT_WATR)
+
+def scene_oil_on_water(sim):
+    """Oil poured onto a pool of water, which it has to float up through"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, w * 0.1, h * 0.6, w * 0.9, h, ElementType.PT_WATR)
+    fill_rect(sim, w * 0.3, h * 0.2, w * 0.7, h * 0.45, ElementType.PT_OIL)
+
+def scene_gunpowder_fire(sim):
+    """A gunpowder heap lit by a line of fire underneath"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, w * 0.2, h * 0.5, w * 0.8, h, ElementType.PT_GUNP)
+    fill_rect(sim, w * 0.2, h * 0.45, w * 0.8, h * 0.5, ElementType.PT_FIRE)
+
+def scene_lava_stone(sim):
+    """Lava spreading over a cold stone floor and cooling down"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, 0, h * 0.8, w, h, ElementType.PT_STONE)
+    fill_rect(sim, w * 0.3, h * 0.3, w * 0.7, h * 0.6, ElementType.PT_LAVA)
+
+def scene_full_grid(sim):
+    """Every cell filled: sand over oil over water, all trying to sort by weight"""
+    w, h = sim.XRES, sim.YRES
+    fill_rect(sim, 0, 0, w, h // 3, ElementType.PT_WATR)
+    fill_rect(sim, 0, h // 3, w, 2 * h // 3, ElementType.PT_SAND)
+    fill_rect(sim, 0, 2 * h // 3, w, h, ElementType.PT_OIL)
+
+# Scenes that fill every cell: they get one particle per cell whatever
+# the configured particle limit
+FULL_SCENES = {'full_grid'}
+
+SCENES = {
+    'sand_avalanche': scene_sand_avalanche,
+    'water_flood': scene_water_flood,
+    'oil_on_water': scene_oil_on_water,
+    'gunpowder_fire': scene_gunpowder_fire,
+    'lava_stone': scene_lava_stone,
+    'full_grid': scene_full_grid,
+}
+
+# =============================================================================
+# CHECKS
+# =============================================================================
+
+def unsupported_powders(sim: PowderToySimulation) -> int:
+    """Powder particles with an empty cell right below them"""
+    tgrid = sim.type_grid()
+    powder = sim.props.falldown[tgrid[:-1]] == 1
+    return int((powder & (tgrid[1:] == ElementType.PT_NONE)).sum())
+
+def check_stroke_settles(storage: str, frames: int = 500):
+    """A stroke of sand and one of salt brushed high up must come to rest"""
+    for element in (ElementType.PT_SAND, ElementType.PT_SALT):
+        sim = PowderToySimulation(storage=storage)
+        try:
+            draw_stroke(sim, 100, 20, 300, 20, element, 5)
+            for _ in range(frames):
+                sim.update_particles()
+            floating = unsupported_powders(sim)
+        finally:
+            sim.close()
+        if floating:
+            return f"{floating} {sim.elements[element].name} particles left in mid-air"
+    return None
+
+def check_kill_at_cell_edge(storage: str):
+    """
+    kill_particles on particles just short of the next cell (x = n + 1 - eps),
+    one beside a neighbour and one on the right edge, must clear their own
+    cells and nothing else
+    """
+    sim = PowderToySimulation(storage=storage)
+    dtype = np.dtype(np.float32 if storage == 'arrays' else np.float64).type
+    try:
+        y = sim.YRES // 2
+        for x in (10, sim.XRES - 1):
+            slot = sim.create_particle(x, y, ElementType.PT_SALT)
+            neighbour = None
+            if x + 1 < sim.XRES:
+                neighbour = sim.create_particle(x + 1, y, ElementType.PT_STONE)
+            slots = np.array([slot])
+            sim.scatter_field('x', slots, np.array([np.nextafter(dtype(x + 1), dtype(x))]))
+            try:
+                sim.kill_particles(slots)
+            except IndexError as exc:
+                return f"killing the particle at x={x} failed: {exc}"
+            if sim.pmap[y, x] != 0:
+                return f"cell ({x}, {y}) still points at the killed particle"
+            if neighbour is not None and sim.pmap[y, x + 1] != neighbour + 1:
+                return f"killing the particle at x={x} cleared its neighbour's cell"
+    finally:
+        sim.close()
+    return None
+
+# Checks by name: (function(storage) -> failure message or None, storage
+# modes it runs in). Powders only fall with the batched kernels, so
+# stroke_settles cannot pass in object storage.
+CHECKS = {
+    'stroke_settles': (check_stroke_settles, ('arrays',)),
+    'kill_at_cell_edge': (check_kill_at_cell_edge, PowderToySimulation.STORAGE_MODES),
+}
+
+def run_checks() -> bool:
+    """Run every check, printing the outcomes; True if all passed"""
+    passed = True
+    for name, (check, storages) in CHECKS.items():
+        for storage in storages:
+            failure = check(storage)
+            print(f"{name} ({storage}): {failure or 'ok'}")
+            passed = passed and failure is None
+    return passed
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+class PhaseTimer:
+    """
+    Times the stages of PowderToySimulation.update_particles by wrapping
+    the simulation's stage entry points. Whatever is left of a frame
+    (mostly the per-particle loop) counts as 'particles'.
+    """
+
+    PHASES = ('air', 'particles', 'reactions', 'kernels', 'heat', 'chunks')
+
+    def __init__(self, sim: PowderToySimulation):
+        self.totals = dict.fromkeys(self.PHASES, 0.0)
+        sim.air.step = self._timed('air', sim.air.step)
+        sim.reactions.step = self._timed('reactions', sim.reactions.step)
+        sim._run_kernels = self._timed('kernels', sim._run_kernels)
+        sim.heat.step = self._timed('heat', sim.heat.step)
+        sim.chunks.tick = self._timed('chunks', sim.chunks.tick)
+
+    def _timed(self, phase: str, function):
+        totals = self.totals
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[phase] += time.perf_counter() - start
+        return timed
+
+    def close_frame(self, frame_seconds: float, staged_before: float):
+        """Attribute the untimed rest of a frame to the particle loop"""
+        staged = sum(self.totals.values()) - staged_before
+        self.totals['particles'] += max(frame_seconds - staged, 0.0)
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, if the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def make_simulation(storage: str, workers: int, npart: int, seed: int = 0,
+                    deterministic: bool = False, xres: int = None,
+                    yres: int = None) -> PowderToySimulation:
+    """Seeded simulation with room for `npart` particles"""
+    return PowderToySimulation(storage=storage, workers=workers, seed=seed,
+                               deterministic=deterministic, xres=xres, yres=yres, npart=npart)
+
+def grid_size(xres: int = None, yres: int = None):
+    """The benchmark grid: the simulation defaults unless given"""
+    return xres or PowderToySimulation.XRES, yres or PowderToySimulation.YRES
+
+def run_scene(name: str, frames: int = 300, warmup: int = 10, storage: str = 'arrays',
+              workers: int = 0, npart: int = None, seed: int = 0,
+              deterministic: bool = False, memory_frames: int = 10,
+              xres: int = None, yres: int = None) -> dict:
+    """Benchmark one scene and return its metrics"""
+    setup = SCENES[name]
+    xres, yres = grid_size(xres, yres)
+    if npart is None or name in FULL_SCENES:
+        npart = max(npart or 0, xres * yres)
+
+    # Memory: traced allocations while building the scene and running a few
+    # frames, in a separate pass so tracing does not slow the timed run
+    tracemalloc.start()
+    sim = make_simulation(storage, workers, npart, seed, deterministic, xres, yres)
+    setup(sim)
+    for _ in range(memory_frames):
+        sim.update_particles()
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    sim.close()
+
+    sim = make_simulation(storage, workers, npart, seed, deterministic, xres, yres)
+    try:
+        setup(sim)
+        start_particles = sim.parts_active
+        for _ in range(warmup):
+            sim.update_particles()
+
+        timer = PhaseTimer(sim)
+        updates = 0
+        elapsed = 0.0
+        for _ in range(frames):
+            updates += sim.parts_active
+            staged_before = sum(timer.totals.values())
+            start = time.perf_counter()
+            sim.update_particles()
+            frame_seconds = time.perf_counter() - start
+            elapsed += frame_seconds
+            timer.close_frame(frame_seconds, staged_before)
+        end_particles = sim.parts_active
+    finally:
+        sim.close()
+
+    return {
+        'frames': frames,
+        'npart': npart,
+        'particles_start': start_particles,
+        'particles_end': end_particles,
+        'steps_per_sec': frames / elapsed,
+        'particle_updates_per_sec': updates / elapsed,
+        'ms_per_step': elapsed / frames * 1000.0,
+        'phase_ms_per_step': {phase: total / frames * 1000.0
+                              for phase, total in timer.totals.items()},
+        'peak_traced_mb': peak_traced / (1024 * 1024),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run_suite(scenes=None, **options) -> dict:
+    """Benchmark several scenes (all by default) and return the JSON report"""
+    scenes = list(scenes or SCENES)
+    for name in scenes:
+        if name not in SCENES:
+            raise ValueError(f"Unknown benchmark scene: {name!r}")
+
+    xres, yres = grid_size(options.get('xres'), options.get('yres'))
+    npart = options.get('npart') or xres * yres
+    storage = options.get('storage', 'arrays')
+    footprint = PowderToySimulation.estimate_footprint(xres, yres, npart, storage)
+    report = {
+        'config': {
+            'storage': storage,
+            'workers': options.get('workers', 0),
+            'frames': options.get('frames', 300),
+            'seed': options.get('seed', 0),
+            'deterministic': options.get('deterministic', False),
+            'grid': [xres, yres],
+            'npart': npart,
+            'footprint_mb': {part: size / (1024 * 1024) for part, size in footprint.items()},
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'scenes': {},
+    }
+    for name in scenes:
+        report['scenes'][name] = run_scene(name, **options)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Powder Toy benchmarks")
+    parser.add_argument('--scene', action='append', choices=sorted(SCENES),
+                        help="scene to run (repeatable; default: all)")
+    parser.add_argument('--frames', type=int, default=300, help="timed frames per scene")
+    parser.add_argument('--warmup', type=int, default=10, help="untimed frames before timing")
+    parser.add_argument('--storage', choices=PowderToySimulation.STORAGE_MODES,
+                        help="particle storage (default: arrays)")
+    parser.add_argument('--workers', type=int, default=0, help="parallel movement workers")
+    parser.add_argument('--preset', choices=sorted(PowderToySimulation.PRESETS),
+                        help="grid size and particle capacity by name")
+    parser.add_argument('--size', help="grid size as WIDTHxHEIGHT (overrides --preset)")
+    parser.add_argument('--npart', type=int, default=None,
+                        help="particle capacity (default: the preset's, or one per grid cell; "
+                             "full_grid always gets one per cell)")
+    parser.add_argument('--seed', type=int, default=0, help="simulation random seed")
+    parser.add_argument('--deterministic', action='store_true',
+                        help="visit particles in raster order (see PowderToySimulation)")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--check', action='store_true',
+                        help="run the correctness checks instead of the benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        if args.storage is not None:
+            parser.error("--check runs every check in the storage modes it applies to; "
+                         "drop --storage")
+        sys.exit(0 if run_checks() else 1)
+    storage = args.storage or 'arrays'
+
+    try:
+        xres, yres, npart = PowderToySimulation.resolve_size(args.preset, args.size, args.npart)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    report = run_suite(args.scene, frames=args.frames, warmup=args.warmup,
+                       storage=storage, workers=args.workers, npart=npart,
+                       seed=args.seed, deterministic=args.deterministic, xres=xres, yres=yres)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
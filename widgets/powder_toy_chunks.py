@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY SLEEPING CHUNKS
+==========================
+
+Activity tracking for PowderToySimulation. The particle grid is split into
+fixed-size chunks; a chunk wakes when anything inside or right next to it
+moves, appears, disappears or changes type, and falls asleep after a run of
+quiet frames. The update stages only process particles in awake chunks, so
+a settled pile of sand or a still pool costs (almost) nothing per frame.
+
+License: GPL-3.0
+"""
+
+import numpy as np
+
+# =============================================================================
+# CHUNK MAP
+# =============================================================================
+
+class ChunkMap:
+    """
+    quiet[cy, cx] counts the frames since chunk (cx, cy) last saw activity.
+    A chunk is awake while quiet < SLEEP_FRAMES. Waking a cell also wakes
+    the chunks holding its 8 neighbours, so activity on a chunk border
+    reaches the particles on the other side.
+    """
+
+    SIZE = 16           # Chunk edge in pixels
+    SLEEP_FRAMES = 30   # Quiet frames before a chunk falls asleep
+
+    def __init__(self, width: int, height: int, allocate=np.zeros):
+        self.width = width
+        self.height = height
+        self.cols = -(-width // self.SIZE)
+        self.rows = -(-height // self.SIZE)
+        self.quiet = allocate((self.rows, self.cols), np.int32)
+        self.quiet.fill(self.SLEEP_FRAMES)
+
+    @property
+    def awake(self) -> np.ndarray:
+        """(rows, cols) bool grid of awake chunks"""
+        return self.quiet < self.SLEEP_FRAMES
+
+    def reset(self):
+        """Put every chunk to sleep"""
+        self.quiet.fill(self.SLEEP_FRAMES)
+
+    def wake(self, x: int, y: int):
+        """Wake the chunks around one cell"""
+        size = self.SIZE
+        cx0, cx1 = max(x - 1, 0) // size, min(x + 1, self.width - 1) // size
+        cy0, cy1 = max(y - 1, 0) // size, min(y + 1, self.height - 1) // size
+        self.quiet[cy0:cy1 + 1, cx0:cx1 + 1] = 0
+
+    def wake_region(self, x0: int, y0: int, x1: int, y1: int):
+        """Wake the chunks around an inclusive rectangle of cells"""
+        size = self.SIZE
+        x0, x1 = max(min(x0, x1) - 1, 0), min(max(x0, x1) + 1, self.width - 1)
+        y0, y1 = max(min(y0, y1) - 1, 0), min(max(y0, y1) + 1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return
+        self.quiet[y0 // size:y1 // size + 1, x0 // size:x1 // size + 1] = 0
+
+    def wake_cells(self, xs: np.ndarray, ys: np.ndarray):
+        """Wake the chunks around many cells at once"""
+        if xs.size == 0:
+            return
+        size = self.SIZE
+        # Chunk size >= 3, so the two corners of each cell's 3x3
+        # neighbourhood per axis cover every chunk it touches
+        for ox in (-1, 1):
+            cx = np.clip(xs + ox, 0, self.width - 1) // size
+            for oy in (-1, 1):
+                cy = np.clip(ys + oy, 0, self.height - 1) // size
+                self.quiet[cy, cx] = 0
+
+    def cell_mask(self, margin: int = 0) -> np.ndarray:
+        """
+        (height, width) bool grid of cells in awake chunks, optionally
+        grown by `margin` chunks in every direction.
+        """
+        mask = self.awake
+        for _ in range(margin):
+            grown = mask.copy()
+            grown[1:, :] |= mask[:-1, :]
+            grown[:-1, :] |= mask[1:, :]
+            grown[:, 1:] |= mask[:, :-1]
+            grown[:, :-1] |= mask[:, 1:]
+            grown[1:, 1:] |= mask[:-1, :-1]
+            grown[1:, :-1] |= mask[:-1, 1:]
+            grown[:-1, 1:] |= mask[1:, :-1]
+            grown[:-1, :-1] |= mask[1:, 1:]
+            mask = grown
+        cells = np.repeat(np.repeat(mask, self.SIZE, axis=0), self.SIZE, axis=1)
+        return cells[:self.height, :self.width]
+
+    def tick(self):
+        """End of frame: every chunk gets one quiet frame older"""
+        np.minimum(self.quiet + 1, self.SLEEP_FRAMES, out=self.quiet)
@@ -20,14 +20,30 @@ Controls:
 - D: Toggle debug display
 - H: Toggle help overlay
 - F: Toggle FPS counter
-- +/- : Increase/Decrease simulation speed
+- M: Cycle display mode (normal, heat, pressure, velocity)
+- G: Toggle fire glow
+- S: Save the sandbox to powder_toy.sav
+- L: Load powder_toy.sav
+- +/- : Increase/Decrease simulation speed (the HUD shows the speed reached
+  within the frame budget next to the one asked for)
 - ESC: Exit
+
+Run with --record session.ptlog to log the session's input for
+powder_toy_replay.py. --preset tpt (or --size WxH with --npart N or
+--memory-mb MB) changes the grid size and particle limit; the window
+grows with the grid.
 """
 
+import argparse
 import pygame
+import os
 import sys
 from powder_toy_engine import PowderToySimulation, ElementType
 from powder_toy_elements import Element
+from powder_toy_brush import BRUSH_SHAPES
+from powder_toy_renderer import SimulationRenderer
+from powder_toy_replay import InputRecorder
+from powder_toy_worker import SimulationWorker
 
 class PowderToy:
     """The Powder Toy - Full Implementation"""
@@ -40,14 +56,18 @@ class PowderToy:
     COLOR_UI_TEXT_DIM = (150, 150, 150)
     COLOR_HIGHLIGHT = (100, 150, 255)
     
-    def __init__(self):
+    SAVE_PATH = "powder_toy.sav"  # Quick save slot (S / L)
+    
+    def __init__(self, record_path=None, storage='objects', xres=None, yres=None, npart=None):
         pygame.init()
         
-        # Window setup
-        self.screen_width = 650
-        self.screen_height = 400
+        # Simulation
+        self.sim = PowderToySimulation(storage=storage, xres=xres, yres=yres, npart=npart)
+        
+        # Window setup: the grid plus the element panel and the bars
+        self.screen_width = self.sim.XRES + 250
+        self.screen_height = self.sim.YRES + 150
         
-        import os
         import ctypes
         try:
             user32 = ctypes.windll.user32
@@ -61,8 +81,14 @@ class PowderToy:
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.NOFRAME)
         pygame.display.set_caption("The Powder Toy - Corner Widget")
         
-        # Simulation
-        self.sim = PowderToySimulation()
+        self.renderer = SimulationRenderer(self.sim, self.COLOR_BG)
+        
+        # The simulation runs on a background worker; the UI only reads its
+        # published frames and queues brush input as commands
+        self.worker = SimulationWorker(self.sim)
+        self.frame = self.worker.latest()
+        if record_path:
+            self.worker.recorder = InputRecorder(record_path, self.sim)
         
         # Rendering settings
         self.sim_scale = 1
@@ -86,6 +112,7 @@ class PowderToy:
         # Input state
         self.mouse_down = [False, False, False]
         self.last_mouse_pos = (0, 0)
+        self.noted = {}  # Last selection/pause/speed passed to the worker
         
         # Fonts
         self.font_small = pygame.font.Font(None, 16)
@@ -204,13 +231,23 @@ class PowderToy:
         elif key == pygame.K_SPACE:
             self.paused = not self.paused
         elif key == pygame.K_r:
-            self.sim.clear_sim()
+            self.worker.perform('clear')
         elif key == pygame.K_h:
             self.show_help = not self.show_help
         elif key == pygame.K_d:
             self.show_debug = not self.show_debug
         elif key == pygame.K_f:
             self.show_fps = not self.show_fps
+        elif key == pygame.K_m:
+            self.renderer.cycle_mode()
+        elif key == pygame.K_g:
+            self.renderer.toggle_glow()
+        elif key == pygame.K_s:
+            # Captured between frames on the worker, written in the background
+            self.worker.submit(self.save_snapshot)
+        elif key == pygame.K_l:
+            if os.path.exists(self.SAVE_PATH):
+                self.worker.perform('load', self.SAVE_PATH)
         elif key == pygame.K_PLUS or key == pygame.K_EQUALS:
             self.simulation_speed = min(self.simulation_speed + 1, 10)
         elif key == pygame.K_MINUS:
@@ -238,6 +275,16 @@ class PowderToy:
         elif key == pygame.K_0:
             self.selected_element = ElementType.PT_WOOD
             
+    def save_snapshot(self):
+        """Worker thread: capture the quick save, reporting write errors when they happen"""
+        self.sim.save(self.SAVE_PATH, True).add_done_callback(self._report_save)
+        
+    def _report_save(self, future):
+        """Writer thread: print why a background save failed"""
+        exc = future.exception()
+        if exc is not None:
+            print(f"Could not save {self.SAVE_PATH}: {exc}")
+            
     def sample_element(self):
         """Sample element under mouse cursor"""
         mouse_x, mouse_y = pygame.mouse.get_pos()
@@ -245,11 +292,10 @@ class PowderToy:
         sim_y = int((mouse_y - self.offset_y) / self.sim_scale)
         
         if 0 <= sim_x < self.sim.XRES and 0 <= sim_y < self.sim.YRES:
-            particle_i = self.sim.pmap[sim_y][sim_x]
-            if particle_i > 0:
-                p = self.sim.particles[particle_i - 1]
-                if p:
-                    self.selected_element = p.type
+            # Read the displayed frame: the live simulation belongs to the worker
+            element_type = int(self.frame.tgrid[sim_y, sim_x])
+            if element_type != ElementType.PT_NONE:
+                self.selected_element = element_type
                     
     def handle_drawing(self):
         """Handle mouse drawing"""
@@ -257,61 +303,26 @@ class PowderToy:
         sim_x = int((mouse_x - self.offset_x) / self.sim_scale)
         sim_y = int((mouse_y - self.offset_y) / self.sim_scale)
         
-        # Draw line from last position (for smooth drawing)
+        # Draw line from last position (for smooth drawing). The stroke is
+        # queued with the element and brush it was drawn with.
+        element = ElementType.PT_NONE if self.mouse_down[2] else self.selected_element
         last_x, last_y = self.last_mouse_pos
-        self.draw_line(last_x, last_y, sim_x, sim_y)
+        self.worker.perform('stroke', last_x, last_y, sim_x, sim_y, element, self.brush_size,
+                            BRUSH_SHAPES.index(self.brush_shape))
         self.last_mouse_pos = (sim_x, sim_y)
         
-    def draw_line(self, x0, y0, x1, y1):
-        """Draw particles along a line (Bresenham's algorithm)"""
-        dx = abs(x1 - x0)
-        dy = abs(y1 - y0)
-        sx = 1 if x0 < x1 else -1
-        sy = 1 if y0 < y1 else -1
-        err = dx - dy
-        
-        while True:
-            self.draw_brush(x0, y0)
-            
-            if x0 == x1 and y0 == y1:
-                break
-                
-            e2 = 2 * err
-            if e2 > -dy:
-                err -= dy
-                x0 += sx
-            if e2 < dx:
-                err += dx
-                y0 += sy
-                
-    def draw_brush(self, cx, cy):
-        """Draw particles with current brush"""
-        element = ElementType.PT_NONE if self.mouse_down[2] else self.selected_element
-        
-        if self.brush_shape == 'circle':
-            for dy in range(-self.brush_size, self.brush_size + 1):
-                for dx in range(-self.brush_size, self.brush_size + 1):
-                    if dx*dx + dy*dy <= self.brush_size*self.brush_size:
-                        x, y = cx + dx, cy + dy
-                        self.place_particle(x, y, element)
-        elif self.brush_shape == 'square':
-            for dy in range(-self.brush_size, self.brush_size + 1):
-                for dx in range(-self.brush_size, self.brush_size + 1):
-                    x, y = cx + dx, cy + dy
-                    self.place_particle(x, y, element)
-                    
-    def place_particle(self, x, y, element):
-        """Place or remove a particle"""
-        if element == ElementType.PT_NONE:
-            self.sim.delete_particle(x, y)
-        else:
-            self.sim.create_particle(x, y, element)
-            
     def update(self):
-        """Update simulation"""
-        if not self.paused:
-            for _ in range(self.simulation_speed):
-                self.sim.update_particles()
+        """Pass the UI settings to the worker and pick up its newest frame"""
+        # Selection, pause and speed changes go into the input log too
+        for action, value in (('select', self.selected_element), ('pause', self.paused),
+                              ('speed', self.simulation_speed)):
+            if self.noted.get(action) != value:
+                self.noted[action] = value
+                self.worker.perform(action, value)
+        self.worker.paused = self.paused
+        self.worker.steps_per_tick = self.simulation_speed
+        self.worker.capture_temp = self.renderer.mode == 'heat'
+        self.frame = self.worker.latest()
                 
     def render(self):
         """Render everything"""
@@ -335,28 +346,14 @@ class PowderToy:
         
     def render_simulation(self):
         """Render the particle simulation"""
-        # Background
         sim_rect = pygame.Rect(self.offset_x, self.offset_y,
-                              self.sim.XRES, self.sim.YRES)
-        pygame.draw.rect(self.screen, self.COLOR_BG, sim_rect)
-        
-        # Particles
-        for y in range(self.sim.YRES):
-            for x in range(self.sim.XRES):
-                particle_i = self.sim.pmap[y][x]
-                if particle_i == 0:
-                    continue
-                    
-                p = self.sim.particles[particle_i - 1]
-                if p is None:
-                    continue
-                    
-                element = self.sim.elements[p.type]
-                color = element.graphics(self.sim, p)
-                
-                screen_x = self.offset_x + x
-                screen_y = self.offset_y + y
-                pygame.draw.rect(self.screen, color, (screen_x, screen_y, 1, 1))
+                              self.sim.XRES * self.sim_scale, self.sim.YRES * self.sim_scale)
+        
+        # Whole frame at once: background and particles in one blit
+        frame = self.renderer.render(self.frame)
+        if self.sim_scale != 1:
+            frame = pygame.transform.scale(frame, sim_rect.size)
+        self.screen.blit(frame, sim_rect)
                 
         # Border
         pygame.draw.rect(self.screen, self.COLOR_UI_BORDER, sim_rect, 2)
@@ -394,13 +391,17 @@ class PowderToy:
             
         # Particle count
         count_text = self.font_medium.render(
-            f"Particles: {self.sim.parts_active}/{self.sim.NPART}",
+            f"Particles: {self.frame.parts_active}/{self.sim.NPART}",
             True, self.COLOR_UI_TEXT_DIM
         )
         self.screen.blit(count_text, (x, 20))
         
         # Speed
-        speed_text = self.font_medium.render(f"Speed: {self.simulation_speed}x", True, self.COLOR_UI_TEXT_DIM)
+        # Speed: achieved of requested, highlighted when the budget holds it back
+        achieved = self.worker.achieved_speed
+        speed_color = (self.COLOR_UI_TEXT_DIM if self.paused or achieved >= 0.95 * self.simulation_speed
+                       else self.COLOR_HIGHLIGHT)
+        speed_text = self.font_medium.render(f"Speed: {achieved:.1f}/{self.simulation_speed}x", True, speed_color)
         self.screen.blit(speed_text, (self.screen_width - 270, 20))
         
         # Help Button (clickable!)
@@ -510,6 +511,9 @@ class PowderToy:
             "  • +/- - Increase/Decrease simulation speed",
             "  • H - Toggle this help (or click ? Help button)",
             "  • D - Toggle debug info",
+            "  • M - Cycle display: normal / heat / pressure / velocity",
+            "  • G - Toggle fire glow",
+            "  • S / L - Save / load the sandbox",
             "",
             "EXPERIMENT IDEAS:",
             "  🔥 Draw GUNPOWDER, then ignite it with FIRE!",
@@ -547,12 +551,16 @@ class PowderToy:
     def render_debug_info(self):
         """Render debug information"""
         debug_lines = [
-            f"Frame: {self.sim.frame_count}",
+            f"Frame: {self.frame.frame_count}",
             f"FPS: {self.fps:.1f}",
-            f"Particles: {self.sim.parts_active}/{self.sim.NPART}",
+            f"Sim step: {self.worker.step_time * 1000:.1f} ms/tick "
+            f"({self.worker.step_cost * 1000:.1f} ms/step, budget {self.worker.frame_budget * 1000:.1f} ms)",
+            f"Backlog: {self.worker.backlog} steps",
+            f"Particles: {self.frame.parts_active}/{self.sim.NPART}",
             f"Grid: {self.sim.XRES}x{self.sim.YRES}",
             f"Brush: {self.brush_size} ({self.brush_shape})",
-            f"Speed: {self.simulation_speed}x",
+            f"Speed: {self.worker.achieved_speed:.1f}x of {self.simulation_speed}x",
+            f"Display: {self.renderer.mode}" + (" + glow" if self.renderer.glow_enabled else ""),
         ]
         
         y = 70
@@ -563,15 +571,21 @@ class PowderToy:
             
     def run(self):
         """Main game loop"""
-        while self.running:
-            # Timing
-            dt = self.clock.tick(60) / 1000.0
-            self.fps = self.clock.get_fps()
-            
-            # Process
-            self.handle_events()
-            self.update()
-            self.render()
+        self.worker.start()
+        try:
+            while self.running:
+                # Timing
+                dt = self.clock.tick(60) / 1000.0
+                self.fps = self.clock.get_fps()
+                
+                # Process
+                self.handle_events()
+                self.update()
+                self.render()
+        finally:
+            self.worker.stop()
+            if self.worker.recorder is not None:
+                self.worker.recorder.close(self.worker.step_count)
             
         pygame.quit()
         sys.exit()
@@ -588,5 +602,43 @@ if __name__ == "__main__":
     print("Starting simulation...")
     print()
     
-    app = PowderToy()
+    parser = argparse.ArgumentParser(description="The Powder Toy - Python Port")
+    parser.add_argument('--record', metavar='PATH',
+                        help="log all input to PATH for powder_toy_replay.py")
+    parser.add_argument('--storage', choices=PowderToySimulation.STORAGE_MODES, default='objects',
+                        help="particle storage ('arrays' scales to large grids)")
+    parser.add_argument('--preset', choices=sorted(PowderToySimulation.PRESETS),
+                        help="grid size and particle limit by name")
+    parser.add_argument('--size', help="grid size as WIDTHxHEIGHT (overrides --preset)")
+    parser.add_argument('--npart', type=int, help="particle limit")
+    parser.add_argument('--memory-mb', type=float,
+                        help="pick the particle limit that fits this many MiB")
+    args = parser.parse_args()
+    
+    try:
+        xres, yres, npart = PowderToySimulation.resolve_size(args.preset, args.size, args.npart)
+    except ValueError as exc:
+        parser.error(str(exc))
+    xres = xres or PowderToySimulation.XRES
+    yres = yres or PowderToySimulation.YRES
+    if args.memory_mb is not None:
+        if args.npart is not None:
+            parser.error("--npart and --memory-mb are exclusive")
+        try:
+            npart = PowderToySimulation.fit_npart(int(args.memory_mb * 1024 * 1024),
+                                                  xres, yres, args.storage)
+        except ValueError as exc:
+            parser.error(str(exc))
+    npart = npart or PowderToySimulation.NPART
+    
+    # Report the memory the simulation will take before allocating it
+    footprint = PowderToySimulation.estimate_footprint(xres, yres, npart, args.storage)
+    parts = ", ".join(f"{name.replace('_', ' ')} {size / 2 ** 20:.1f}"
+                      for name, size in footprint.items())
+    print(f"Grid {xres}x{yres}, up to {npart} particles ({args.storage} storage): "
+          f"{sum(footprint.values()) / 2 ** 20:.1f} MiB ({parts})")
+    print()
+    
+    app = PowderToy(record_path=args.record, storage=args.storage,
+                    xres=xres, yres=yres, npart=npart)
     app.run()
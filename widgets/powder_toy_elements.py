@@ -6,9 +6,10 @@ POWDER TOY ELEMENT DEFINITIONS - EXPANDED
 Extended element library with more particle types.
 """
 
-from dataclasses import dataclass
-from typing import Optional, Tuple, TYPE_CHECKING
-import random
+from dataclasses import dataclass, fields
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
 
 if TYPE_CHECKING:
     from powder_toy_engine import PowderToySimulation, Particle
@@ -33,13 +34,16 @@ class Element:
     gravity: float = 0.0      # Additional gravity force
     loss: float = 0.95        # Velocity dampening (0-1)
     collision: float = 0.0    # Collision coefficient
-    diffusion: float = 0.0    # Diffusion rate
+    diffusion: float = 0.0    # Diffusion rate (chance of a random step per frame)
+    advection: float = 0.0    # How strongly air currents carry the particle
     
     # Movement behavior
     falldown: int = 0         # 0=none, 1=powder, 2=liquid, 3=gas
+    lifetime: int = 0         # Frames before the particle dies (0 = forever)
     
     # Thermal properties
     heat_conduct: int = 0     # Heat conductivity (0-255)
+    heat_emission: float = 0.0  # Heat given to each neighbouring particle per frame
     default_temp: float = 295.15  # Default temperature (Kelvin)
     
     # State transitions
@@ -57,6 +61,7 @@ class Element:
     # Rendering
     menu_visible: bool = True  # Show in element menu
     menu_section: int = 0     # Category (0=powders, 1=liquids, etc.)
+    glow: float = 0.0         # Glow intensity in the renderer's glow layer (0 = none)
     
     def update(self, sim: 'PowderToySimulation', i: int, x: int, y: int):
         """
@@ -65,6 +70,18 @@ class Element:
         """
         pass
         
+    def update_many(self, sim: 'PowderToySimulation', indices: np.ndarray,
+                    xs: np.ndarray, ys: np.ndarray):
+        """
+        Update all of this element's awake particles in one call: slot
+        indices and their cells. Calls update() for each by default;
+        override with a bulk version. Elements overriding neither are
+        never called.
+        """
+        for i, x, y in zip(indices.tolist(), xs.tolist(), ys.tolist()):
+            if sim.particles[i] is not None:
+                self.update(sim, i, x, y)
+        
     def graphics(self, sim: 'PowderToySimulation', particle: 'Particle') -> Tuple[int, int, int]:
         """
         Get display color for this particle.
@@ -72,6 +89,44 @@ class Element:
         """
         return self.color
 
+# =============================================================================
+# ELEMENT PROPERTY TABLES
+# =============================================================================
+
+class ElementTable:
+    """
+    Element properties compiled into arrays indexed by element ID, one per
+    numeric Element field (table.weight, table.loss, ...) plus table.color
+    as (n, 3) uint8. Bulk code gathers a property for many particles with
+    one indexing operation: table.weight[types]. Unused IDs read as 0.
+
+    The Element objects stay the definitions; compile a new table after
+    changing one.
+    """
+    
+    # Array dtype per Element field type; other fields (strings) are skipped
+    DTYPES = {int: np.int32, float: np.float32, bool: bool}
+    
+    def __init__(self, elements: List[Optional[Element]]):
+        self.size = len(elements)
+        self.names = []
+        for field in fields(Element):
+            if field.name == 'color':
+                array = np.zeros((self.size, 3), dtype=np.uint8)
+            elif field.type in self.DTYPES:
+                array = np.zeros(self.size, dtype=self.DTYPES[field.type])
+            else:
+                continue
+            for i, element in enumerate(elements):
+                if element is not None:
+                    array[i] = getattr(element, field.name)
+            array.flags.writeable = False  # Shared by every stage
+            setattr(self, field.name, array)
+            self.names.append(field.name)
+    
+    def __len__(self) -> int:
+        return self.size
+
 # =============================================================================
 # ELEMENT IMPLEMENTATIONS
 # =============================================================================
@@ -98,6 +153,7 @@ class Element_DUST(Element):
             weight=75,              # Heavy powder
             gravity=0.1,
             loss=0.95,
+            advection=0.7,
             falldown=1,             # Powder behavior
             heat_conduct=70,
             menu_section=0          # Powders category
@@ -113,6 +169,7 @@ class Element_WATR(Element):
             weight=20,              # Light liquid
             gravity=0.1,
             loss=0.98,
+            advection=0.6,
             falldown=2,             # Liquid behavior
             heat_conduct=251,       # High heat conductivity
             default_temp=295.15,    # Room temp
@@ -130,11 +187,23 @@ class Element_WATR(Element):
             return
             
         # Try to spread left/right
-        if random.random() < 0.5:
-            direction = 1 if random.random() < 0.5 else -1
+        if sim.random.random() < 0.5:
+            direction = 1 if sim.random.random() < 0.5 else -1
             nx = x + direction
-            if 0 <= nx < sim.XRES and sim.pmap[y][nx] == 0:
+            if 0 <= nx < sim.XRES and sim.pmap[y, nx] == 0:
                 p.vx += direction * 0.5
+                
+    def update_many(self, sim, indices, xs, ys):
+        """Bulk version of update for all water particles at once"""
+        spread = sim.rng.random(indices.size) < 0.5
+        direction = np.where(sim.rng.random(indices.size) < 0.5, 1, -1)
+        nx = xs + direction
+        spread &= (nx >= 0) & (nx < sim.XRES)
+        spread[spread] = sim.pmap[ys[spread], nx[spread]] == 0
+        
+        pushed = indices[spread]
+        vx = sim.gather_field('vx', pushed) + direction[spread] * 0.5
+        sim.scatter_field('vx', pushed, vx)
 
 class Element_SAND(Element):
     """Heavy sand"""
@@ -146,6 +215,7 @@ class Element_SAND(Element):
             weight=90,              # Very heavy
             gravity=0.15,
             loss=0.90,
+            advection=0.4,
             falldown=1,             # Powder behavior
             heat_conduct=70,
             high_temp=1973.15,      # Melts at 1700°C
@@ -163,34 +233,16 @@ class Element_FIRE(Element):
             weight=-2,              # Negative weight = rises
             gravity=-0.1,           # Upward force
             loss=0.92,
+            diffusion=0.5,          # Flickers sideways as it rises
+            advection=0.9,          # Carried easily by the air
             falldown=3,             # Gas behavior
+            lifetime=50,            # Lives for ~50 frames
             heat_conduct=88,
+            heat_emission=10.0,     # Heats its surroundings
             default_temp=600.0,     # Hot!
-            menu_section=2          # Gases category
+            menu_section=2,         # Gases category
+            glow=1.0                # Bright flames
         )
-        
-    def update(self, sim, i, x, y):
-        """Fire behavior: has lifetime, generates heat"""
-        p = sim.particles[i]
-        if p is None:
-            return
-            
-        # Decay over time
-        p.life += 1
-        if p.life > 50:  # Lives for ~50 frames
-            sim.delete_particle(x, y)
-            return
-            
-        # Heat nearby particles
-        for dy in [-1, 0, 1]:
-            for dx in [-1, 0, 1]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < sim.XRES and 0 <= ny < sim.YRES:
-                    ni = sim.pmap[ny][nx]
-                    if ni > 0:
-                        other = sim.particles[ni - 1]
-                        if other:
-                            other.temp += 10.0  # Heat transfer
 
 class Element_STONE(Element):
     """Solid stone - doesn't move"""
@@ -218,33 +270,17 @@ class Element_LAVA(Element):
             weight=45,              # Medium-heavy liquid
             gravity=0.1,
             loss=0.95,
+            advection=0.3,
             falldown=2,             # Liquid behavior
             heat_conduct=255,       # Maximum heat conductivity
+            heat_emission=50.0,     # Heats its surroundings intensely
             default_temp=2273.15,   # 2000°C - very hot!
             low_temp=1273.15,       # Solidifies below 1000°C
             low_temp_transition=5,  # PT_STONE
             flammable=0,
-            menu_section=1          # Liquids
+            menu_section=1,         # Liquids
+            glow=0.6                # Glows red-hot
         )
-        
-    def update(self, sim, i, x, y):
-        """Lava heats and ignites nearby particles"""
-        p = sim.particles[i]
-        if p is None:
-            return
-            
-        # Heat nearby particles intensely
-        for dy in [-1, 0, 1]:
-            for dx in [-1, 0, 1]:
-                if dx == 0 and dy == 0:
-                    continue
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < sim.XRES and 0 <= ny < sim.YRES:
-                    ni = sim.pmap[ny][nx]
-                    if ni > 0:
-                        other = sim.particles[ni - 1]
-                        if other:
-                            other.temp += 50.0  # Intense heating
 
 class Element_GUNP(Element):
     """Gunpowder - explodes when ignited"""
@@ -256,6 +292,7 @@ class Element_GUNP(Element):
             weight=85,
             gravity=0.1,
             loss=0.92,
+            advection=0.7,
             falldown=1,             # Powder
             heat_conduct=70,
             high_temp=673.15,       # Ignites at 400°C
@@ -266,7 +303,7 @@ class Element_GUNP(Element):
         )
 
 class Element_SALT(Element):
-    """Salt - dissolves in water"""
+    """Salt - dissolves in water (see get_reaction_list)"""
     def __init__(self):
         super().__init__(
             identifier="SALT",
@@ -275,33 +312,12 @@ class Element_SALT(Element):
             weight=95,
             gravity=0.12,
             loss=0.90,
+            advection=0.4,
             falldown=1,             # Powder
             heat_conduct=110,
             high_temp=1074.15,      # Melts at 801°C
             menu_section=0          # Powders
         )
-        
-    def update(self, sim, i, x, y):
-        """Salt dissolves in water"""
-        p = sim.particles[i]
-        if p is None:
-            return
-            
-        # Check for water neighbors
-        for dy in [-1, 0, 1]:
-            for dx in [-1, 0, 1]:
-                if dx == 0 and dy == 0:
-                    continue
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < sim.XRES and 0 <= ny < sim.YRES:
-                    ni = sim.pmap[ny][nx]
-                    if ni > 0:
-                        other = sim.particles[ni - 1]
-                        if other and other.type == 2:  # PT_WATR
-                            # Dissolve into water
-                            if random.random() < 0.05:
-                                sim.delete_particle(x, y)
-                                return
 
 class Element_OIL(Element):
     """Oil - flammable liquid, floats on water"""
@@ -313,6 +329,7 @@ class Element_OIL(Element):
             weight=10,              # Lighter than water!
             gravity=0.08,
             loss=0.97,
+            advection=0.6,
             falldown=2,             # Liquid
             heat_conduct=40,
             flammable=20,
@@ -357,3 +374,13 @@ def get_element_list():
     elements[ElementType.PT_WOOD] = Element_WOOD()
     
     return elements
+
+def get_reaction_list(elements):
+    """Return the reaction rules between the given elements (see powder_toy_reactions)"""
+    from powder_toy_engine import ElementType
+    from powder_toy_reactions import Reaction
+    
+    return [
+        # Salt dissolves in water
+        Reaction(ElementType.PT_SALT, ElementType.PT_WATR, 0.05, ElementType.PT_NONE),
+    ]
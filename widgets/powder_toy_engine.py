@@ -13,13 +13,14 @@ Python implementation Copyright (c) 2026.
 License: GPL-3.0
 """
 
-import pygame
 import random
-import math
+import sys
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from enum import IntEnum
 
+import numpy as np
+
 # =============================================================================
 # ELEMENT TYPE DEFINITIONS
 # =============================================================================
@@ -61,6 +62,110 @@ class Particle:
     flags: int = 0     # Particle flags
     dcolour: int = 0   # Decoration color (ARGB)
 
+# Field layout for the structure-of-arrays particle store. Order and names
+# mirror the Particle dataclass above.
+PARTICLE_FIELDS = (
+    ('type', np.int32),
+    ('x', np.float32),
+    ('y', np.float32),
+    ('vx', np.float32),
+    ('vy', np.float32),
+    ('temp', np.float32),
+    ('life', np.int32),
+    ('ctype', np.int32),
+    ('tmp', np.int32),
+    ('tmp2', np.int32),
+    ('flags', np.uint32),
+    ('dcolour', np.uint32),
+)
+
+def _particle_object_bytes() -> int:
+    """Approximate size of one Particle object: instance, __dict__ and float fields"""
+    p = Particle(type=1, x=0.5, y=0.5, vx=0.5, vy=0.5, temp=295.15)
+    fields = vars(p)
+    floats = sum(sys.getsizeof(value) for value in fields.values() if isinstance(value, float))
+    return sys.getsizeof(p) + sys.getsizeof(fields) + floats
+
+class ParticleView:
+    """
+    Thin view over one slot of a ParticleArrays store.
+    Attribute reads and writes go straight to the backing arrays, so element
+    code can treat it exactly like a Particle.
+    """
+    __slots__ = ('_store', 'index')
+    
+    def __init__(self, store: 'ParticleArrays', index: int):
+        self._store = store
+        self.index = index
+        
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name, _ in PARTICLE_FIELDS)
+        return f"ParticleView({self.index}: {fields})"
+
+def _view_field(name: str):
+    """Build a property that proxies one ParticleView field to its array"""
+    def getter(self):
+        return self._store.fields[name][self.index].item()
+        
+    def setter(self, value):
+        self._store.fields[name][self.index] = value
+        
+    return property(getter, setter)
+
+for _name, _ in PARTICLE_FIELDS:
+    setattr(ParticleView, _name, _view_field(_name))
+
+class ParticleArrays:
+    """
+    Structure-of-arrays particle storage.
+    Every Particle field lives in its own typed NumPy array of length NPART,
+    so a particle costs 48 bytes instead of a full Python object and whole
+    populations can be processed with array operations. A slot is dead when
+    its type is PT_NONE.
+    
+    Indexing mimics the List[Optional[Particle]] storage: store[i] returns a
+    ParticleView (or None for a dead slot) and store[i] = None clears a slot.
+    """
+    
+    def __init__(self, npart: int, allocate=np.zeros):
+        self.npart = npart
+        self.fields = {name: allocate(npart, dtype) for name, dtype in PARTICLE_FIELDS}
+        
+        # Direct attribute access for bulk code (arrays.type, arrays.temp, ...)
+        for name, array in self.fields.items():
+            setattr(self, name, array)
+            
+    def __len__(self) -> int:
+        return self.npart
+        
+    def __iter__(self):
+        for i in range(self.npart):
+            yield self[i]
+            
+    def __getitem__(self, i: int) -> Optional[ParticleView]:
+        if not self.type[i]:  # PT_NONE marks a dead slot
+            return None
+        return ParticleView(self, i)
+        
+    def __setitem__(self, i: int, particle: Optional[Particle]):
+        if particle is None:
+            for array in self.fields.values():
+                array[i] = 0
+            return
+            
+        for name, array in self.fields.items():
+            array[i] = getattr(particle, name)
+            
+    def clear(self):
+        """Mark every slot dead and zero all fields"""
+        for array in self.fields.values():
+            array.fill(0)
+            
+    @property
+    def nbytes(self) -> int:
+        """Total size of the backing arrays in bytes"""
+        return sum(array.nbytes for array in self.fields.values())
+
 # =============================================================================
 # SIMULATION CORE
 # =============================================================================
@@ -71,51 +176,299 @@ class PowderToySimulation:
     and the update loop. Based on TPT's Simulation class.
     """
     
-    # Simulation dimensions (matching TPT defaults)
+    # Default simulation dimensions; each simulation can pick its own (see
+    # __init__), and XRES/YRES/XCELLS/YCELLS/NPART are then set per instance
     XRES = 400  # Simulation width in pixels (Reduced for widget)
     YRES = 250  # Simulation height in pixels (Reduced for widget)
     CELL = 4    # Cell size for air simulation (XRES/CELL x YRES/CELL grid)
     
     # Grid cell counts
-    XCELLS = XRES // CELL  # 153 cells
-    YCELLS = YRES // CELL  # 96 cells
+    XCELLS = XRES // CELL  # 100 cells
+    YCELLS = YRES // CELL  # 62 cells
     
     # Particle limits
     NPART = 5000  # Maximum particles (TPT uses ~50,000, we start smaller)
     
-    def __init__(self):
-        """Initialize the simulation"""
+    # Named sizes: (XRES, YRES, NPART). 'tpt' is The Powder Toy's own
+    # configuration, one particle per pixel.
+    PRESETS = {
+        'widget': (400, 250, 5000),
+        'tpt': (612, 384, 612 * 384),
+    }
+    
+    # Particle storage backends: a list of Particle objects, or parallel
+    # NumPy arrays (ParticleArrays) viewed through ParticleView
+    STORAGE_MODES = ('objects', 'arrays')
+    
+    # Row window of the grids this object covers. A full simulation starts
+    # at row 0 and owns every row; the parallel workers' band views do not.
+    row_origin = 0
+    owned_rows = None
+    
+    def __init__(self, storage: str = 'objects', workers: int = 0,
+                 seed: Optional[int] = None, deterministic: bool = False,
+                 xres: Optional[int] = None, yres: Optional[int] = None,
+                 npart: Optional[int] = None, memory_budget: Optional[int] = None):
+        """
+        Initialize the simulation. workers > 0 runs the batched movement
+        stages in that many worker processes (array storage only).
+        
+        All randomness comes from generators seeded with `seed` (a random
+        seed if None; see self.seed). With deterministic=True particles are
+        also visited in raster order instead of slot order, so identical
+        grids and inputs give bit-identical results however the slots
+        happen to be numbered.
+        
+        The grid is xres x yres pixels and holds up to npart particles (the
+        class defaults if None). Instead of npart, memory_budget (bytes)
+        picks the most particles whose storage fits in it along with the
+        grids, at most one per pixel. self.footprint reports the sizes.
+        """
+        if storage not in self.STORAGE_MODES:
+            raise ValueError(f"Unknown particle storage mode: {storage!r}")
+        if workers < 0:
+            raise ValueError(f"Worker count must not be negative: {workers}")
+        if workers and storage != 'arrays':
+            raise ValueError("Parallel update needs storage='arrays'")
+        self.storage = storage
+        self.deterministic = deterministic
+        
+        # Dimensions: every grid and array below is sized from these
+        self.XRES = self.XRES if xres is None else xres
+        self.YRES = self.YRES if yres is None else yres
+        if self.XRES < self.CELL or self.YRES < self.CELL:
+            raise ValueError(f"Grid must be at least {self.CELL}x{self.CELL} pixels: "
+                             f"{self.XRES}x{self.YRES}")
+        self.XCELLS = self.XRES // self.CELL
+        self.YCELLS = self.YRES // self.CELL
+        if memory_budget is not None:
+            if npart is not None:
+                raise ValueError("Pass either npart or memory_budget, not both")
+            npart = self.fit_npart(memory_budget, self.XRES, self.YRES, storage)
+        self.NPART = self.NPART if npart is None else npart
+        if self.NPART < 1:
+            raise ValueError(f"Particle limit must be positive: {self.NPART}")
+        self.footprint = self.estimate_footprint(self.XRES, self.YRES, self.NPART, storage)
+        
+        # Random generators: self.random for scalar draws in element code,
+        # self.rng (NumPy) for the bulk stages
+        self.reseed(seed)
+        
+        # Grids the parallel workers touch are allocated in shared memory
+        self._arena = self._initialize_arena(workers)
+        self._allocate = self._arena.zeros if self._arena is not None else np.zeros
         
         # Particle storage
-        self.particles: List[Optional[Particle]] = [None] * self.NPART
-        self.pfree = 0  # Next free particle index
+        self.particles = self._new_particle_store()
+        self.pfree = 0  # High-water mark: slots >= pfree have never been used
         self.parts_active = 0  # Count of active particles
         
-        # Particle map: pmap[y][x] = particle index (0 = empty)
-        # This lets us quickly find which particle is at a given position
-        self.pmap = [[0] * self.XRES for _ in range(self.YRES)]
+        # Slot allocator: deleted slots go onto a free-list stack and are
+        # reused before pfree advances. generation[i] is bumped whenever
+        # slot i is released, so stale (index, generation) handles are caught.
+        self.free_slots: List[int] = []
+        self.generation = np.zeros(self.NPART, dtype=np.uint32)
+        
+        # Dense index of live slots: active[:parts_active] holds every live
+        # particle index and active_pos[i] is slot i's position in it (-1 if
+        # dead). Deletes swap-remove, so per-frame work scales with
+        # parts_active instead of NPART.
+        self.active = self._allocate(self.NPART, np.int32)
+        self.active_pos = np.full(self.NPART, -1, dtype=np.int32)
+        
+        # Particle map: pmap[y, x] = particle index + 1 (0 = empty)
+        # This lets us quickly find which particle is at a given position.
+        self.pmap = self._allocate((self.YRES, self.XRES), np.int32)
+        
+        # Sleeping chunks: only particles in awake chunks are updated.
+        # slot_awake marks this frame's awake particles for the bulk stages.
+        self.chunks = self._initialize_chunks()
+        self.slot_awake = self._allocate(self.NPART, bool)
         
         # Photon layer (separate from normal particles, for PHOT element)
-        self.photons = [[0] * self.XRES for _ in range(self.YRES)]
+        self.photons = np.zeros((self.YRES, self.XRES), dtype=np.int32)
         
-        # Air simulation grids
-        self.vx = [[0.0] * self.XCELLS for _ in range(self.YCELLS)]  # Air velocity X
-        self.vy = [[0.0] * self.XCELLS for _ in range(self.YCELLS)]  # Air velocity Y
-        self.pv = [[0.0] * self.XCELLS for _ in range(self.YCELLS)]  # Air pressure
-        self.hv = [[0.0] * self.XCELLS for _ in range(self.YCELLS)]  # Heat (temperature)
+        # Air simulation grids, advanced by the air solver (see powder_toy_air)
+        air_shape = (self.YCELLS, self.XCELLS)
+        self.vx = self._allocate(air_shape, np.float32)  # Air velocity X
+        self.vy = self._allocate(air_shape, np.float32)  # Air velocity Y
+        self.pv = np.zeros(air_shape, dtype=np.float32)  # Air pressure
+        self.hv = np.zeros(air_shape, dtype=np.float32)  # Heat (temperature)
+        self.air = self._initialize_air()
+        self.air.reset(self)
+        self._air_velocity = None  # List copies of vx/vy for per-particle physics
         
-        # Elements registry
+        # Elements registry, and its properties compiled into arrays indexed
+        # by element ID (self.props.weight[types] etc.) for the bulk stages
         self.elements = self._initialize_elements()
+        self.props = self._initialize_properties()
+        
+        # Update dispatch groups: only element types that override the
+        # no-op Element.update get called, once per frame per type
+        self._update_types = self._initialize_update_groups()
+        
+        # Elements that keep their chunk awake: they age or heat their
+        # surroundings even when nothing moves
+        self._restless = (self.props.lifetime > 0) | (self.props.heat_emission > 0)
+        
+        # Batched movement stages (array storage only). Particles whose
+        # falldown class has a kernel skip the per-particle physics step.
+        self.kernels = self._initialize_kernels()
+        self._batched = np.isin(self.props.falldown, [kernel.falldown for kernel in self.kernels])
+        
+        # Pairwise reactions between touching elements, evaluated in bulk
+        self.reactions = self._initialize_reactions()
+        
+        # Bulk heat stage (conduction, emission, state transitions)
+        self.heat = self._initialize_heat()
+        
+        # Worker processes for the movement stages (None = run in-process)
+        self.parallel = self._initialize_parallel(workers)
         
         # Simulation state
         self.frame_count = 0
         self.paused = False
         
+    @classmethod
+    def estimate_footprint(cls, xres: int, yres: int, npart: int,
+                           storage: str = 'objects') -> Dict[str, int]:
+        """
+        Bytes of a simulation's long-lived allocations by component, without
+        creating it. Object storage is counted with every slot holding a
+        live Particle (its worst case); per-frame temporaries are not
+        included.
+        """
+        from powder_toy_chunks import ChunkMap
+        if storage == 'arrays':
+            per_particle = sum(np.dtype(dtype).itemsize for _, dtype in PARTICLE_FIELDS)
+        else:
+            per_particle = 8 + _particle_object_bytes()  # List slot + object
+        chunks = -(-xres // ChunkMap.SIZE) * -(-yres // ChunkMap.SIZE)
+        return {
+            'particles': npart * per_particle,
+            'slot_index': npart * 13,           # generation, active, active_pos, slot_awake
+            'grids': xres * yres * 8,           # pmap, photons
+            'air': (xres // cls.CELL) * (yres // cls.CELL) * 16,  # vx, vy, pv, hv
+            'chunks': chunks * 4,
+        }
+        
+    @classmethod
+    def fit_npart(cls, memory_budget: int, xres: int, yres: int,
+                  storage: str = 'objects') -> int:
+        """Most particles (at most one per pixel) that fit in memory_budget bytes"""
+        fixed = cls.estimate_footprint(xres, yres, 0, storage)
+        per_particle = cls.estimate_footprint(xres, yres, 1, storage)
+        per_particle = sum(per_particle.values()) - sum(fixed.values())
+        npart = min((memory_budget - sum(fixed.values())) // per_particle, xres * yres)
+        if npart < 1:
+            raise ValueError(f"Memory budget of {memory_budget} bytes is too small for a "
+                             f"{xres}x{yres} grid ({sum(fixed.values())} bytes before particles)")
+        return int(npart)
+        
+    @classmethod
+    def resolve_size(cls, preset: Optional[str] = None, size: Optional[str] = None,
+                     npart: Optional[int] = None) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """
+        (xres, yres, npart) from command-line options: a PRESETS name, a
+        'WIDTHxHEIGHT' size that overrides the preset's grid, and a particle
+        limit that overrides the preset's. Values nothing sets are None.
+        """
+        xres = yres = None
+        if preset is not None:
+            if preset not in cls.PRESETS:
+                raise ValueError(f"Unknown size preset: {preset!r}")
+            xres, yres, preset_npart = cls.PRESETS[preset]
+            npart = npart or preset_npart
+        if size is not None:
+            try:
+                xres, yres = (int(n) for n in size.lower().split('x'))
+            except ValueError:
+                raise ValueError(f"Grid size must look like 612x384: {size!r}") from None
+        return xres, yres, npart
+        
+    def reseed(self, seed: Optional[int] = None):
+        """Restart the random generators from `seed` (a fresh random seed if None)"""
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 32)
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.rng = np.random.default_rng(seed)
+        
     def _initialize_elements(self):
         """Initialize element definitions"""
         from powder_toy_elements import get_element_list
         return get_element_list()
         
+    def _initialize_properties(self):
+        """Compile the element definitions into per-property arrays"""
+        from powder_toy_elements import ElementTable
+        return ElementTable(self.elements)
+        
+    def _initialize_kernels(self):
+        """Initialize batched movement kernels for array storage"""
+        if self.storage != 'arrays':
+            return []
+        from powder_toy_kernels import build_kernels
+        return build_kernels(self.props)
+        
+    def _initialize_update_groups(self) -> List[int]:
+        """Element types with their own update or update_many"""
+        from powder_toy_elements import Element
+        return [t for t, element in enumerate(self.elements)
+                if element is not None
+                and (type(element).update is not Element.update
+                     or type(element).update_many is not Element.update_many)]
+        
+    def _initialize_reactions(self):
+        """Initialize the element reaction rules"""
+        from powder_toy_elements import get_reaction_list
+        from powder_toy_reactions import ReactionTable
+        return ReactionTable(self.props, get_reaction_list(self.elements))
+        
+    def _initialize_chunks(self):
+        """Initialize the sleeping-chunk map over the particle grid"""
+        from powder_toy_chunks import ChunkMap
+        return ChunkMap(self.XRES, self.YRES, self._allocate)
+        
+    def _initialize_air(self):
+        """Initialize the air solver for the cell grids"""
+        from powder_toy_air import AirSolver
+        return AirSolver(self.CELL)
+        
+    def _initialize_heat(self):
+        """Initialize the bulk heat solver"""
+        from powder_toy_heat import HeatSolver
+        return HeatSolver(self.props)
+        
+    def _initialize_arena(self, workers: int):
+        """Shared memory for the parallel update, if enabled"""
+        if not workers:
+            return None
+        from powder_toy_parallel import SharedArena
+        return SharedArena()
+        
+    def _initialize_parallel(self, workers: int):
+        """Start the band workers, if enabled"""
+        if not workers:
+            return None
+        from powder_toy_parallel import ParallelUpdater
+        return ParallelUpdater(self, workers)
+        
+    def close(self):
+        """Stop the parallel workers and release shared memory"""
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+        if self._arena is not None:
+            self._arena.close()
+            self._arena = None
+            
+    def _new_particle_store(self):
+        """Allocate empty particle storage for the configured mode"""
+        if self.storage == 'arrays':
+            return ParticleArrays(self.NPART, self._allocate)
+        return [None] * self.NPART
+        
     def create_particle(self, x: int, y: int, element_type: int) -> Optional[int]:
         """
         Create a new particle at the given position.
@@ -128,16 +481,13 @@ class PowderToySimulation:
             return None
             
         # Check if position is occupied
-        if self.pmap[y][x] != 0:
+        if self.pmap[y, x] != 0:
             return None
             
         # Find free particle slot
-        if self.pfree >= self.NPART:
+        i = self._allocate_slot()
+        if i is None:
             return None  # Too many particles
-            
-        i = self.pfree
-        self.pfree += 1
-        self.parts_active += 1
         
         # Create particle
         element = self.elements[element_type]
@@ -149,7 +499,8 @@ class PowderToySimulation:
         )
         
         self.particles[i] = p
-        self.pmap[y][x] = i + 1  # Store index+1 (0 means empty)
+        self.pmap[y, x] = i + 1  # Store index+1 (0 means empty)
+        self.chunks.wake(x, y)
         
         return i
         
@@ -158,38 +509,437 @@ class PowderToySimulation:
         if x < 0 or x >= self.XRES or y < 0 or y >= self.YRES:
             return
             
-        i = self.pmap[y][x]
+        i = int(self.pmap[y, x])
         if i == 0:
             return
             
         # Clear particle
-        self.particles[i - 1] = None
-        self.pmap[y][x] = 0
+        self.pmap[y, x] = 0
+        self.chunks.wake(x, y)
+        self._release_slot(i - 1)
+        
+    def create_particles(self, mask: np.ndarray, x0: int, y0: int,
+                         element_type: int) -> np.ndarray:
+        """
+        Create particles in bulk: one in every free cell where the boolean
+        `mask` is set, with the mask's top-left corner at (x0, y0). Parts of
+        the mask outside the grid are ignored; cells are filled in raster
+        order until NPART is reached. Returns the new particle indices.
+        """
+        ys, xs = self._mask_cells(mask, x0, y0)
+        free = self.pmap[ys, xs] == 0
+        ys, xs = ys[free], xs[free]
+        
+        slots = self._allocate_slots(xs.size)
+        ys, xs = ys[:slots.size], xs[:slots.size]
+        if slots.size == 0:
+            return slots
+            
+        temp = self.elements[element_type].default_temp
+        if self.storage == 'arrays':
+            # Released and never-used slots are all zero already
+            self.particles.type[slots] = element_type
+            self.particles.x[slots] = xs
+            self.particles.y[slots] = ys
+            self.particles.temp[slots] = temp
+        else:
+            for i, x, y in zip(slots.tolist(), xs.tolist(), ys.tolist()):
+                self.particles[i] = Particle(type=element_type, x=float(x), y=float(y), temp=temp)
+                
+        self.pmap[ys, xs] = slots + 1
+        self.chunks.wake_cells(xs, ys)
+        return slots
+        
+    def delete_region(self, mask: np.ndarray, x0: int, y0: int) -> int:
+        """
+        Delete every particle where the boolean `mask` is set, with the
+        mask's top-left corner at (x0, y0). Returns how many were deleted.
+        """
+        ys, xs = self._mask_cells(mask, x0, y0)
+        slots = self.pmap[ys, xs].astype(np.int64) - 1
+        hit = slots >= 0
+        ys, xs, slots = ys[hit], xs[hit], slots[hit]
+        if slots.size:
+            self.pmap[ys, xs] = 0
+            self.chunks.wake_cells(xs, ys)
+            self._release_slots(slots)
+        return int(slots.size)
+        
+    def _mask_cells(self, mask: np.ndarray, x0: int, y0: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Grid cells (ys, xs) of the set mask entries that fall inside the grid"""
+        height, width = mask.shape
+        left, top = max(x0, 0), max(y0, 0)
+        right, bottom = min(x0 + width, self.XRES), min(y0 + height, self.YRES)
+        if left >= right or top >= bottom:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        ys, xs = np.nonzero(mask[top - y0:bottom - y0, left - x0:right - x0])
+        return ys + top, xs + left
+        
+    def _allocate_slot(self) -> Optional[int]:
+        """Take a slot from the free list, or a fresh one past pfree"""
+        if self.free_slots:
+            i = self.free_slots.pop()
+        elif self.pfree < self.NPART:
+            i = self.pfree
+            self.pfree += 1
+        else:
+            return None
+            
+        self.active[self.parts_active] = i
+        self.active_pos[i] = self.parts_active
+        self.parts_active += 1
+        return i
+        
+    def _allocate_slots(self, count: int) -> np.ndarray:
+        """
+        Take up to `count` slots at once, in the order _allocate_slot would
+        hand them out. Fewer are returned when NPART is reached.
+        """
+        reused = min(count, len(self.free_slots))
+        fresh = min(count - reused, self.NPART - self.pfree)
+        slots = np.concatenate((
+            np.array(self.free_slots[len(self.free_slots) - reused:][::-1], dtype=np.int64),
+            np.arange(self.pfree, self.pfree + fresh, dtype=np.int64)))
+        del self.free_slots[len(self.free_slots) - reused:]
+        self.pfree += fresh
+        
+        positions = np.arange(self.parts_active, self.parts_active + slots.size)
+        self.active[positions] = slots
+        self.active_pos[slots] = positions
+        self.parts_active += slots.size
+        return slots
+        
+    def _release_slot(self, i: int):
+        """Kill the particle in slot i and hand the slot back to the free list"""
+        self.particles[i] = None
+        self.generation[i] += 1
+        self.free_slots.append(i)
+        
+        # Swap-remove from the dense active index
         self.parts_active -= 1
+        pos = self.active_pos[i]
+        last = self.active[self.parts_active]
+        self.active[pos] = last
+        self.active_pos[last] = pos
+        self.active_pos[i] = -1
+        
+    def set_particle_type(self, i: int, element_type: int):
+        """
+        Change a live particle's element type. Changing to PT_NONE kills
+        the particle and removes it from the grid and the active index.
+        """
+        p = self.particles[i]
+        if p is None:
+            return
+            
+        x, y = int(p.x), int(p.y)
+        self.chunks.wake(x, y)
+        if element_type == ElementType.PT_NONE:
+            self.pmap[y, x] = 0
+            self._release_slot(i)
+            return
+            
+        p.type = element_type
+        
+    def particle_handle(self, i: int) -> Tuple[int, int]:
+        """Return a (index, generation) handle that goes stale when slot i is freed"""
+        return i, int(self.generation[i])
+        
+    def resolve_handle(self, handle: Tuple[int, int]) -> Optional[int]:
+        """Return the particle index for a handle, or None if it is stale"""
+        i, generation = handle
+        if self.generation[i] != generation or self.particles[i] is None:
+            return None
+        return i
+        
+    def compact_particles(self) -> int:
+        """
+        Pack live particles into slots 0..parts_active-1 and reset the
+        free list. Moved particles get new indices, so every handle to a
+        moved slot is invalidated. Returns the number of particles moved.
+        """
+        live = [i for i in range(self.pfree) if self.particles[i] is not None]
+        count = len(live)
+        
+        # remap[old index + 1] = new index + 1, matching pmap's encoding
+        remap = np.zeros(self.NPART + 1, dtype=np.int64)
+        remap[np.asarray(live, dtype=np.int64) + 1] = np.arange(1, count + 1)
+        moved = [(old, new) for new, old in enumerate(live) if old != new]
+        
+        if self.storage == 'arrays':
+            order = np.asarray(live, dtype=np.int64)
+            for array in self.particles.fields.values():
+                array[:count] = array[order]
+                array[count:self.pfree] = 0
+        else:
+            packed = [self.particles[i] for i in live]
+            self.particles[:self.pfree] = packed + [None] * (self.pfree - count)
+            
+        self.pmap[:] = remap[self.pmap]
+        
+        for old, _ in moved:
+            self.generation[old] += 1
+            
+        self.active[:count] = np.arange(count)
+        self.active_pos.fill(-1)
+        self.active_pos[:count] = np.arange(count)
+        
+        self.free_slots = []
+        self.pfree = count
+        return len(moved)
         
     def update_particles(self):
         """
         Main particle update loop - called once per frame.
         Based on TPT's UpdateParticles function.
         """
-        for i in range(self.NPART):
-            p = self.particles[i]
-            if p is None or p.type == ElementType.PT_NONE:
+        # 0. Air: pressure, velocity and ambient heat on the cell grids
+        self.air.step(self)
+        self._air_velocity = None
+        if self.storage == 'objects' and not self.air.is_still(self):
+            # Plain lists: per-particle lookups into NumPy arrays are slow
+            self._air_velocity = (self.vx.tolist(), self.vy.tolist())
+            
+        # Work on a snapshot of the awake particles: particles deleted during
+        # the frame are swap-removed from the live index as we go. What each
+        # particle needs is decided up front from its type, in bulk.
+        slots = self._select_awake()
+        types = self.gather_field('type', slots)
+        physics = ~self._batched[types]  # No kernel for its falldown class
+        ages = physics & (self.props.lifetime[types] > 0)
+        
+        # Array storage: forces for the per-particle physics step in one go;
+        # the loop below only moves the particles
+        bulk_forces = self.storage == 'arrays'
+        if bulk_forces and physics.any():
+            self._apply_forces(slots[physics], types[physics])
+            
+        # 1. Element-specific updates: one call per element type with an
+        # update, covering all of its awake particles
+        for element_type in self._update_types:
+            group = slots[types == element_type]
+            if group.size:
+                xs, ys = self.particle_cells(group)
+                self.elements[element_type].update_many(self, group, xs, ys)
+                
+        # 2. Lifetime and physics, one particle at a time, for classes
+        # without a kernel. With array storage, particles that stay in
+        # their cell or bounce off the edge are settled in bulk first.
+        loop, loop_ages = slots[physics], ages[physics]
+        if bulk_forces and loop.size:
+            keep = loop_ages.copy()
+            keep[~loop_ages] = ~self._settle_in_place(loop[~loop_ages])
+            loop, loop_ages = loop[keep], loop_ages[keep]
+        for i, aging in zip(loop.tolist(), loop_ages.tolist()):
+            if aging and not self._update_particle_life(i):
                 continue
+            if bulk_forces:
+                p = self.particles[i]
+                if p is not None:
+                    self._try_move_particle(i, p.x + p.vx, p.y + p.vy)
+            else:
+                self._update_particle_physics(i)
                 
-            x, y = int(p.x), int(p.y)
-            element = self.elements[p.type]
+        # One type grid is shared by the bulk stages, which keep it in sync
+        tgrid = self.type_grid()
+        
+        # 3. Reactions between touching particles
+        self.reactions.step(self, tgrid)
+        
+        # 4. Batched movement for whole falldown classes
+        if self.kernels:
+            self._run_kernels(tgrid)
             
-            # 1. Element-specific update (custom behaviors)
-            element.update(self, i, x, y)
+        # 5. Heat transfer and state transitions
+        self.heat.step(self, tgrid)
+        
+        self.chunks.tick()
+        self.frame_count += 1
+        
+    def _select_awake(self) -> np.ndarray:
+        """
+        Mark this frame's awake particles in slot_awake and return their
+        slots in index order (raster order in deterministic mode). Restless
+        elements keep their chunks awake.
+        """
+        self.slot_awake.fill(False)
+        if not self.chunks.awake.any():
+            return np.zeros(0, dtype=np.int32)
             
-            # 2. Physics: Apply gravity and movement
-            self._update_particle_physics(i)
+        ys, xs = np.nonzero((self.pmap != 0) & self.chunks.cell_mask())
+        slots = self.pmap[ys, xs] - 1
+        if not self.deterministic:
+            # Slot order, like TPT; deterministic mode keeps raster order
+            order = np.argsort(slots)
+            slots, xs, ys = slots[order], xs[order], ys[order]
+        
+        restless = self._restless[self.gather_field('type', slots)]
+        if restless.any():
+            self.chunks.wake_cells(xs[restless], ys[restless])
             
-            # 3. Heat transfer
-            self._update_particle_heat(i)
+        self.slot_awake[slots] = True
+        return slots
+        
+    def _update_particle_life(self, i: int) -> bool:
+        """Age a particle with a limited lifetime; returns False once it has burned out"""
+        p = self.particles[i]
+        if p is None:
+            return False
             
-        self.frame_count += 1
+        lifetime = self.elements[p.type].lifetime
+        if lifetime <= 0:
+            return True
+            
+        p.life += 1
+        if p.life > lifetime:
+            self.delete_particle(int(p.x), int(p.y))
+            return False
+        return True
+        
+    def kill_particles(self, indices: np.ndarray):
+        """Delete many particles at once, given their slot indices"""
+        xs, ys = self.particle_cells(indices)
+        self.pmap[ys, xs] = 0
+        self.chunks.wake_cells(xs, ys)
+        self._release_slots(indices)
+        
+    def _release_slots(self, indices: np.ndarray):
+        """Bulk _release_slot for unique live slots"""
+        if self.storage == 'arrays':
+            for array in self.particles.fields.values():
+                array[indices] = 0
+        else:
+            for i in indices.tolist():
+                self.particles[i] = None
+        self.generation[indices] += 1
+        self.free_slots.extend(indices.tolist())
+        
+        # Swap-remove from the dense active index: survivors from the tail
+        # fill the holes the released slots leave in front of it
+        count = self.parts_active - indices.size
+        positions = self.active_pos[indices]
+        self.active_pos[indices] = -1
+        holes = np.sort(positions[positions < count])
+        tail = self.active[count:self.parts_active]
+        movers = tail[self.active_pos[tail] >= 0]
+        self.active[holes] = movers
+        self.active_pos[movers] = holes
+        self.parts_active = count
+            
+    def _run_kernels(self, tgrid: np.ndarray):
+        """Run every batched movement stage over a shared type grid"""
+        for kernel in self.kernels:
+            kernel.prepare(self, tgrid)
+        if self.parallel is not None:
+            self.parallel.step(self, tgrid)
+            return
+        for kernel in self.kernels:
+            kernel.step(self, tgrid)
+        
+    def gather_field(self, name: str, indices: np.ndarray) -> np.ndarray:
+        """Read one particle field for many slots as an array"""
+        if self.storage == 'arrays':
+            return self.particles.fields[name][indices]
+        return np.array([getattr(self.particles[i], name) for i in indices.tolist()],
+                        dtype=dict(PARTICLE_FIELDS)[name])
+        
+    def particle_cells(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Grid cells (xs, ys) of many particles, truncating their positions
+        like int(p.x) does. Object storage keeps float64 positions, which
+        gather_field's float32 could round up into the next cell.
+        """
+        if self.storage == 'arrays':
+            fields = self.particles.fields
+            return fields['x'][indices].astype(np.int64), fields['y'][indices].astype(np.int64)
+        particles = [self.particles[i] for i in indices.tolist()]
+        return (np.array([int(p.x) for p in particles], dtype=np.int64),
+                np.array([int(p.y) for p in particles], dtype=np.int64))
+        
+    def scatter_field(self, name: str, indices: np.ndarray, values: np.ndarray):
+        """Write one particle field for many slots from an array"""
+        if self.storage == 'arrays':
+            self.particles.fields[name][indices] = values
+            return
+        for i, value in zip(indices.tolist(), values.tolist()):
+            setattr(self.particles[i], name, value)
+            
+    # -------------------------------------------------------------------------
+    # Grid queries
+    # -------------------------------------------------------------------------
+    
+    def cell_coords(self, x, y):
+        """Air grid cell (cx, cy) containing pixel (x, y); accepts scalars or arrays"""
+        # YRES need not be a multiple of CELL: the last partial row of
+        # pixels belongs to the last cell row
+        return np.minimum(x // self.CELL, self.XCELLS - 1), np.minimum(y // self.CELL, self.YCELLS - 1)
+        
+    def type_grid(self) -> np.ndarray:
+        """Element type of every cell as a (YRES, XRES) int32 grid (0 = empty)"""
+        return self.field_grid('type')
+        
+    def field_grid(self, name: str) -> np.ndarray:
+        """One particle field laid out as a (YRES, XRES) grid (0 where empty)"""
+        dtype = dict(PARTICLE_FIELDS)[name]
+        if self.storage == 'arrays':
+            slot_values = self.particles.fields[name]
+        else:
+            slot_values = np.zeros(self.NPART, dtype=dtype)
+            for i in self.active[:self.parts_active].tolist():
+                slot_values[i] = getattr(self.particles[i], name)
+                
+        # Prepend the empty entry so pmap values index it directly
+        lookup = np.concatenate((np.zeros(1, dtype=dtype), slot_values))
+        return lookup[self.pmap]
+        
+    def _apply_forces(self, slots: np.ndarray, types: np.ndarray):
+        """
+        Bulk version of the velocity half of _update_particle_physics for
+        array storage: gravity and dampening for many particles, with each
+        property gathered for all of them at once. (Air currents move array
+        particles through the drift kernel instead.)
+        """
+        props = self.props
+        parts = self.particles
+        vx = parts.vx[slots].astype(np.float64)
+        vy = parts.vy[slots].astype(np.float64)
+        
+        gravity = props.gravity[types].astype(np.float64) + 0.1  # Base gravity
+        vy += np.where(props.weight[types] > 0, gravity, 0.0)
+        loss = props.loss[types]
+        vx *= loss
+        vy *= loss
+        
+        parts.vx[slots] = vx
+        parts.vy[slots] = vy
+        
+    def _settle_in_place(self, slots: np.ndarray) -> np.ndarray:
+        """
+        The outcomes of _try_move_particle that move nothing, for many array
+        storage particles at once: a particle whose velocity keeps it in its
+        own cell is blocked by itself (velocity halved), one heading off the
+        grid bounces. Returns which particles were settled; the others still
+        need _try_move_particle. A settled particle that a later move swaps
+        out of its cell keeps its outcome for this frame.
+        """
+        parts = self.particles
+        x = parts.x[slots].astype(np.float64)
+        y = parts.y[slots].astype(np.float64)
+        vx = parts.vx[slots].astype(np.float64)
+        vy = parts.vy[slots].astype(np.float64)
+        target_x = (x + vx).astype(np.int64)
+        target_y = (y + vy).astype(np.int64)
+        
+        off_x = (target_x < 0) | (target_x >= self.XRES)
+        off_y = (target_y < 0) | (target_y >= self.YRES)
+        outside = off_x | off_y
+        stay = ~outside & (target_x == x.astype(np.int64)) & (target_y == y.astype(np.int64))
+        
+        settled = stay | outside
+        parts.vx[slots] = np.where(stay, vx * 0.5, np.where(off_x, vx * -0.8, vx))
+        parts.vy[slots] = np.where(stay, vy * 0.5, np.where(off_y, vy * -0.8, vy))
+        return settled
         
     def _update_particle_physics(self, i: int):
         """Update particle position based on velocity and gravity"""
@@ -207,6 +957,14 @@ class PowderToySimulation:
         p.vx *= element.loss
         p.vy *= element.loss
         
+        # Get carried by the air
+        if element.advection and self._air_velocity:
+            air_vx, air_vy = self._air_velocity
+            cx = min(int(p.x) // self.CELL, self.XCELLS - 1)
+            cy = min(int(p.y) // self.CELL, self.YCELLS - 1)
+            p.vx += element.advection * air_vx[cy][cx]
+            p.vy += element.advection * air_vy[cy][cx]
+        
         # Update position
         new_x = p.x + p.vx
         new_y = p.y + p.vy
@@ -222,6 +980,7 @@ class PowderToySimulation:
             
         old_x, old_y = int(p.x), int(p.y)
         target_x, target_y = int(new_x), int(new_y)
+        moved_cell = target_x != old_x or target_y != old_y
         
         # Check bounds
         if target_x < 0 or target_x >= self.XRES or target_y < 0 or target_y >= self.YRES:
@@ -233,24 +992,29 @@ class PowderToySimulation:
             return
             
         # Check if target position is free
-        if self.pmap[target_y][target_x] == 0:
+        if self.pmap[target_y, target_x] == 0:
             # Clear old position
-            self.pmap[old_y][old_x] = 0
+            self.pmap[old_y, old_x] = 0
             # Move to new position
             p.x, p.y = new_x, new_y
-            self.pmap[target_y][target_x] = i + 1
+            self.pmap[target_y, target_x] = i + 1
+            if moved_cell:
+                self.chunks.wake(old_x, old_y)
+                self.chunks.wake(target_x, target_y)
         else:
             # Position occupied - try to swap based on density
-            other_i = self.pmap[target_y][target_x] - 1
+            other_i = self.pmap[target_y, target_x] - 1
             other = self.particles[other_i]
             
             if other and self._should_swap(p, other):
                 # Swap particles
-                self.pmap[old_y][old_x] = other_i + 1
-                self.pmap[target_y][target_x] = i + 1
+                self.pmap[old_y, old_x] = other_i + 1
+                self.pmap[target_y, target_x] = i + 1
                 
                 p.x, p.y = new_x, new_y
                 other.x, other.y = float(old_x), float(old_y)
+                self.chunks.wake(old_x, old_y)
+                self.chunks.wake(target_x, target_y)
             else:
                 # Can't move - stop
                 p.vx *= 0.5
@@ -264,35 +1028,72 @@ class PowderToySimulation:
         # Heavier sinks below lighter
         return e1.weight > e2.weight
         
-    def _update_particle_heat(self, i: int):
-        """Update particle temperature and check state transitions"""
-        p = self.particles[i]
-        if p is None:
-            return
-            
-        element = self.elements[p.type]
-        
-        # Heat conduction (simplified - full version uses neighbors)
-        if element.heat_conduct > 0:
-            # Ambient cooling/heating
-            p.temp += (295.15 - p.temp) * 0.001
-            
-        # State transitions
-        if element.low_temp > 0 and p.temp < element.low_temp:
-            # Freeze
-            if element.low_temp_transition != ElementType.PT_NONE:
-                p.type = element.low_temp_transition
-                
-        if element.high_temp > 0 and p.temp > element.high_temp:
-            # Melt/boil
-            if element.high_temp_transition != ElementType.PT_NONE:
-                p.type = element.high_temp_transition
-                
     def clear_sim(self):
         """Clear all particles and reset simulation"""
-        self.particles = [None] * self.NPART
-        self.pmap = [[0] * self.XRES for _ in range(self.YRES)]
-        self.photons = [[0] * self.XRES for _ in range(self.YRES)]
+        if self.storage == 'arrays':
+            self.particles.clear()  # In place: the arrays may be shared
+        else:
+            self.particles = self._new_particle_store()
+        self.pmap.fill(0)
+        self.photons.fill(0)
+        self.air.reset(self)
+        self.chunks.reset()
+        self.slot_awake.fill(False)
         self.pfree = 0
         self.parts_active = 0
+        self.free_slots = []
+        self.generation += 1  # Invalidate every outstanding handle
+        self.active_pos.fill(-1)
         self.frame_count = 0
+        self.reseed(self.seed)  # A cleared simulation replays like a new one
+        
+    def save(self, path: str, background: bool = False):
+        """
+        Save the simulation to a snapshot file (see powder_toy_save). The
+        state is captured right away; with background=True the file is
+        written on a writer thread and a Future is returned.
+        """
+        from powder_toy_save import save_snapshot
+        return save_snapshot(self, path, background)
+        
+    def load(self, path: str):
+        """
+        Replace the simulation's state with a snapshot file. Particles land
+        in the lowest slots; the random generators and sleeping chunks
+        continue where they were when the snapshot was taken.
+        """
+        from powder_toy_save import open_snapshot, element_identifiers
+        snapshot = open_snapshot(path)
+        if (snapshot.xres, snapshot.yres) != (self.XRES, self.YRES):
+            raise ValueError(f"Snapshot grid is {snapshot.xres}x{snapshot.yres}, "
+                             f"simulation is {self.XRES}x{self.YRES}")
+        count = snapshot.count
+        if count > self.NPART:
+            raise ValueError(f"Snapshot holds {count} particles, NPART is {self.NPART}")
+        remap = snapshot.type_remap(element_identifiers(self.elements))
+        types = remap[snapshot.fields['type']]
+        
+        self.clear_sim()
+        if self.storage == 'arrays':
+            for name, array in self.particles.fields.items():
+                array[:count] = types if name == 'type' else snapshot.fields[name]
+        else:
+            names = [name for name, _ in PARTICLE_FIELDS]
+            columns = [types.tolist() if name == 'type' else snapshot.fields[name].tolist()
+                       for name in names]
+            for i, values in enumerate(zip(*columns)):
+                self.particles[i] = Particle(**dict(zip(names, values)))
+        self.pmap[:] = snapshot.pmap
+        for name, grid in snapshot.air.items():
+            getattr(self, name)[:] = grid
+            
+        self.pfree = count
+        self.parts_active = count
+        self.active[:count] = np.arange(count)
+        self.active_pos[:count] = np.arange(count)
+        self.frame_count = snapshot.frame_count
+        self.seed = snapshot.seed
+        version, internal, gauss_next = snapshot.generators['random']
+        self.random.setstate((version, tuple(internal), gauss_next))
+        self.rng.bit_generator.state = snapshot.generators['rng']
+        self.chunks.quiet[:] = snapshot.chunks
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY HEAT SOLVER
+======================
+
+Bulk heat stage for PowderToySimulation, run once per frame after movement.
+Temperatures are laid out on the particle grid and updated with whole-array
+NumPy operations: conduction between touching particles, heat emitted by
+sources such as FIRE and LAVA, slow exchange with the air heat grid (hv),
+and the resulting state transitions.
+
+License: GPL-3.0
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from powder_toy_elements import ElementTable
+    from powder_toy_engine import PowderToySimulation
+
+# =============================================================================
+# HEAT SOLVER
+# =============================================================================
+
+class HeatSolver:
+    """
+    Explicit conduction over the 4-neighbour edges of the particle grid.
+    Each edge moves heat in proportion to the temperature difference and the
+    lower of the two elements' heat_conduct, so every exchange is symmetric
+    and heat is conserved. Empty cells and heat_conduct=0 elements insulate.
+    """
+
+    # Fraction of the difference exchanged per frame across an edge between
+    # two heat_conduct=255 particles. Four edges per cell, so staying below
+    # 0.25 keeps the explicit update stable.
+    CONDUCTION_RATE = 0.2
+
+    # Conducting particles exchange heat with the air of their cell (sim.hv)
+    AMBIENT_RATE = 0.001
+
+    # Temperature change per frame that wakes a particle's chunk
+    HEAT_WAKE = 0.01
+
+    def __init__(self, props: 'ElementTable'):
+        self.conduct = props.heat_conduct.astype(np.float32) / 255.0
+        self.emission = props.heat_emission
+        self.low_temp = props.low_temp
+        self.low_transition = props.low_temp_transition
+        self.high_temp = props.high_temp
+        self.high_transition = props.high_temp_transition
+        self.emitters = bool(self.emission.any())
+
+    def step(self, sim: 'PowderToySimulation', tgrid: np.ndarray):
+        """
+        Conduct, emit and exchange heat, then apply transitions, for the
+        particles in awake chunks and the chunks around them. Everything
+        else counts as empty (insulating), so no heat leaks into sleeping
+        chunks; a particle that warms or cools noticeably wakes its chunk.
+        """
+        region = sim.chunks.cell_mask(margin=1)
+        occupied = (tgrid != 0) & region
+        rows = np.flatnonzero(occupied.any(axis=1))
+        if rows.size == 0:
+            return
+        cols = np.flatnonzero(occupied.any(axis=0))
+
+        # Work on the bounding box of the particles only
+        box = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+        types = tgrid[box] * region[box]
+        cells = np.flatnonzero(occupied[box])
+        slots = sim.pmap[box].ravel()[cells] - 1
+        part_types = types.ravel()[cells]
+
+        old_temps = sim.gather_field('temp', slots)
+        temp = np.zeros(types.shape, dtype=np.float32)
+        temp.ravel()[cells] = old_temps
+        conduct = self.conduct[types]
+
+        # Per-particle temperatures after conduction, then emission and
+        # air exchange on the particles alone
+        new_temps = (temp + self._conduction(temp, conduct)).ravel()[cells]
+        if self.emitters:
+            new_temps += self._emission(types).ravel()[cells]
+        ys, xs = np.divmod(cells, types.shape[1])
+        ys += rows[0]
+        xs += cols[0]
+        cx, cy = sim.cell_coords(xs, ys)
+        air_cells = cy * sim.XCELLS + cx
+        new_temps += self._air_exchange(sim, air_cells, part_types, new_temps)
+
+        changing = np.abs(new_temps - old_temps) > self.HEAT_WAKE
+        sim.chunks.wake_cells(xs[changing], ys[changing])
+
+        sim.scatter_field('temp', slots, new_temps)
+        self._transitions(sim, slots, part_types, new_temps)
+
+    def _air_exchange(self, sim: 'PowderToySimulation', air_cells: np.ndarray,
+                      types: np.ndarray, temps: np.ndarray) -> np.ndarray:
+        """
+        Temperature change of each particle from the air of its cell; the
+        same heat goes the other way into the air heat grid.
+        """
+        hv = sim.hv.reshape(-1)
+        rate = self.AMBIENT_RATE * (self.conduct[types] > 0)
+        exchange = (hv[air_cells] - temps) * rate
+        hv -= np.bincount(air_cells, weights=exchange, minlength=hv.size).astype(np.float32)
+        return exchange
+
+    def _conduction(self, temp: np.ndarray, conduct: np.ndarray) -> np.ndarray:
+        """Net temperature change of every cell from its horizontal and vertical edges"""
+        delta = np.zeros_like(temp)
+
+        k = np.minimum(conduct[:, :-1], conduct[:, 1:]) * self.CONDUCTION_RATE
+        flux = k * (temp[:, 1:] - temp[:, :-1])
+        delta[:, :-1] += flux
+        delta[:, 1:] -= flux
+
+        k = np.minimum(conduct[:-1, :], conduct[1:, :]) * self.CONDUCTION_RATE
+        flux = k * (temp[1:, :] - temp[:-1, :])
+        delta[:-1, :] += flux
+        delta[1:, :] -= flux
+        return delta
+
+    def _emission(self, types: np.ndarray) -> np.ndarray:
+        """
+        Heat each cell receives from emitting elements in its 8-neighbourhood.
+        Emitters do not heat their own kind, so a pool of LAVA can still cool.
+        Scattered from the emitters, so the cost scales with their number.
+        """
+        height, width = types.shape
+        ey, ex = np.nonzero(self.emission[types])
+        received = np.zeros((height + 2, width + 2), dtype=np.float32)
+        if ey.size == 0:
+            return received[1:-1, 1:-1]
+
+        source = types[ey, ex]
+        amount = self.emission[source]
+        padded = np.pad(types, 1)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                if dx == 1 and dy == 1:
+                    continue
+                # One offset at a time, so every target cell is unique
+                ny, nx = ey + dy, ex + dx
+                received[ny, nx] += amount * (padded[ny, nx] != source)
+        return received[1:-1, 1:-1]
+
+    def _transitions(self, sim: 'PowderToySimulation', slots: np.ndarray,
+                     types: np.ndarray, temps: np.ndarray):
+        """Freeze or melt particles whose temperature crossed their element's limits"""
+        low = self.low_temp[types]
+        freeze = (low > 0) & (temps < low) & (self.low_transition[types] != 0)
+        high = self.high_temp[types]
+        melt = (high > 0) & (temps > high) & (self.high_transition[types] != 0)
+
+        for i, t in zip(slots[freeze].tolist(), self.low_transition[types[freeze]].tolist()):
+            sim.set_particle_type(i, t)
+        for i, t in zip(slots[melt].tolist(), self.high_transition[types[melt]].tolist()):
+            sim.set_particle_type(i, t)
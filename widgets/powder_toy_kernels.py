@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY MOVEMENT KERNELS
+===========================
+
+Batched movement stages for PowderToySimulation's array storage mode.
+Instead of moving one particle at a time through _try_move_particle, each
+kernel advances every particle of one falldown class together with NumPy
+array operations over the particle grid.
+
+License: GPL-3.0
+"""
+
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from powder_toy_elements import ElementTable
+    from powder_toy_engine import PowderToySimulation
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def apply_moves(sim: 'PowderToySimulation', tgrid: np.ndarray,
+                sx: np.ndarray, sy: np.ndarray, dx: np.ndarray, dy: np.ndarray):
+    """
+    Move the particles at (sx, sy) into (dx, dy), swapping with whatever
+    occupies the destination. Keeps pmap, the frame's type grid and the
+    particle positions in sync.
+
+    Sources must be unique, destinations must be unique, and no cell may be
+    both a source and a destination - the parity passes guarantee this.
+    Rows are relative to sim.row_origin, like sim.pmap and tgrid.
+    """
+    pmap = sim.pmap
+    parts = sim.particles
+    origin = sim.row_origin
+
+    moving = pmap[sy, sx]
+    displaced = pmap[dy, dx]
+    pmap[dy, dx] = moving
+    pmap[sy, sx] = displaced
+
+    moving_types = tgrid[sy, sx]
+    tgrid[sy, sx] = tgrid[dy, dx]
+    tgrid[dy, dx] = moving_types
+
+    i = moving - 1
+    parts.x[i] = dx
+    parts.y[i] = dy + origin
+    sim.chunks.wake_cells(sx, sy + origin)
+    sim.chunks.wake_cells(dx, dy + origin)
+
+    swapped = displaced != 0
+    j = displaced[swapped] - 1
+    parts.x[j] = sx[swapped]
+    parts.y[j] = sy[swapped] + origin
+
+# =============================================================================
+# KERNELS
+# =============================================================================
+
+class ParticleBatch:
+    """
+    Slot indices, types and integer cell positions of the particles a
+    kernel moves. Rows are counted from `origin` (sim.row_origin).
+    """
+
+    __slots__ = ('idx', 'types', 'xs', 'ys', 'origin')
+
+    def __init__(self, parts, idx: np.ndarray, origin: int = 0):
+        self.idx = idx
+        self.types = parts.type[idx]
+        self.origin = origin
+        self.refresh(parts)
+
+    @property
+    def size(self) -> int:
+        return self.idx.size
+
+    def refresh(self, parts):
+        """Re-read cell positions after particles were moved outside the batch"""
+        self.xs = parts.x[self.idx].astype(np.int64)
+        self.ys = parts.y[self.idx].astype(np.int64) - self.origin
+
+class MovementKernel:
+    """
+    Base class for batched movement stages, built from two kinds of pass:
+
+    - Column shifts move every vertical run of movers one cell at once, so
+      stacked particles fall (or rise) together instead of tearing apart.
+    - Offset passes shift single particles by (dx, dy) into cells the
+      displacement table allows. Sources are limited to one row parity
+      (column parity for sideways passes), so destinations always sit on
+      the other parity: no cell is both a source and a destination, and no
+      two particles can claim the same cell.
+
+    Kernels work in the row window of their simulation object: pmap and
+    tgrid start at sim.row_origin, and when sim.owned_rows is set only the
+    particles in those rows are moved (see powder_toy_parallel).
+    """
+
+    falldown = 0  # Element.falldown class handled by this kernel
+
+    def __init__(self, props: 'ElementTable'):
+        self.falldown_table = props.falldown
+        self.weight = props.weight
+
+        # Cells a moving particle may enter: empty, or a lighter fluid
+        ntypes = len(self.weight)
+        empty = np.zeros(ntypes, dtype=bool)
+        empty[0] = True
+        fluid = (self.falldown_table == 2) | (self.falldown_table == 3)
+        lighter = self.weight[None, :] < self.weight[:, None]
+        self.sink_table = empty[None, :] | (fluid[None, :] & lighter)
+
+    def select(self, sim: 'PowderToySimulation') -> np.ndarray:
+        """Slot indices of every awake particle in this kernel's falldown class"""
+        active = sim.active[:sim.parts_active]
+        types = sim.particles.type[active]
+        chosen = (self.falldown_table[types] == self.falldown) & sim.slot_awake[active]
+        if sim.owned_rows is not None:
+            chosen &= self._owned(sim, active)
+        return self._ordered(sim, active[chosen])
+
+    def prepare(self, sim: 'PowderToySimulation', tgrid: np.ndarray):
+        """
+        Serial work before the movement passes, always run on the full
+        simulation (e.g. removing particles). Nothing by default.
+        """
+
+    def step(self, sim: 'PowderToySimulation', tgrid: np.ndarray):
+        """Advance every particle of this class by one frame"""
+        raise NotImplementedError
+
+    def _ordered(self, sim: 'PowderToySimulation', idx: np.ndarray) -> np.ndarray:
+        """
+        The slots in raster order in deterministic mode, so random draws do
+        not depend on how slots are numbered; unchanged otherwise.
+        """
+        if not sim.deterministic or idx.size == 0:
+            return idx
+        parts = sim.particles
+        return idx[np.lexsort((parts.x[idx], parts.y[idx]))]
+
+    def _owned(self, sim: 'PowderToySimulation', idx: np.ndarray) -> np.ndarray:
+        """Which of the slots lie in sim.owned_rows"""
+        y0, y1 = sim.owned_rows
+        ys = sim.particles.y[idx]
+        return (ys >= y0) & (ys < y1)
+
+    def _fall(self, sim: 'PowderToySimulation', tgrid: np.ndarray, batch: ParticleBatch):
+        """
+        Shared falling stage for powders and liquids, per row parity:
+        shift falling runs down one cell, let resting particles sink into
+        lighter fluids of their own class, then slide diagonally (preferred
+        side first). Parity and preferred side alternate every frame.
+        """
+        first = sim.frame_count & 1
+        side = 1 if first else -1
+        for parity in (first, first ^ 1):
+            fell = self._column_shift(sim, tgrid, batch, self.sink_table, 1)
+
+            # Particles still falling never sink or slide
+            resting = ~fell
+            self._move_pass(sim, tgrid, batch, 0, 1, parity, self.sink_table,
+                            eligible=resting)
+            for dx in (side, -side):
+                self._move_pass(sim, tgrid, batch, dx, 1, parity, self.sink_table,
+                                blocked=(0, 1), eligible=resting)
+
+    def _column_shift(self, sim: 'PowderToySimulation', tgrid: np.ndarray,
+                      batch: ParticleBatch, table: np.ndarray, dy: int) -> np.ndarray:
+        """
+        Shift every vertical run of this kernel's particles one cell along
+        dy (+1 down, -1 up) when its leading particle is in the batch and
+        the cell past it can be entered and holds nothing of this class. The
+        displaced contents of that cell (empty or a lighter fluid) move to
+        the trailing end of the run. Only columns with a run that can move
+        are touched. Returns which particles of the batch moved.
+        """
+        height = tgrid.shape[0]
+        xs, ys = batch.xs, batch.ys
+
+        # Leading particles: the cell ahead is not one of ours and can be entered
+        ny = ys + dy
+        inside = (ny >= 0) & (ny < height)
+        ahead = np.zeros(batch.size, dtype=tgrid.dtype)
+        ahead[inside] = tgrid[ny[inside], xs[inside]]
+        lead = inside & (self.falldown_table[ahead] != self.falldown) & table[batch.types, ahead]
+        if not lead.any():
+            return np.zeros(batch.size, dtype=bool)
+
+        # Work on the affected columns only, flipped so runs advance downwards
+        cols, lx = np.unique(xs[lead], return_inverse=True)
+        ly = ys[lead] if dy > 0 else height - 1 - ys[lead]
+        psub = sim.pmap[:, cols]
+        tsub = tgrid[:, cols]
+        if dy < 0:
+            psub, tsub = psub[::-1], tsub[::-1]
+        movers = self.falldown_table[tsub] == self.falldown
+
+        # Spread each leading particle's verdict up its run: for every mover,
+        # find the first non-mover below it and check the cell above that
+        rows = np.arange(height, dtype=np.int64)[:, None]
+        blockers = np.where(movers, height, rows)
+        end = np.minimum.accumulate(blockers[::-1], axis=0)[::-1]
+        go = np.zeros(tsub.shape, dtype=bool)
+        go[ly, lx] = True
+        falling = movers & go[np.clip(end - 1, 0, height - 1), np.arange(cols.size)[None, :]]
+
+        # Trailing particle of each moving run, paired with its leading
+        # particle by walking both in column-major order
+        trail = falling.copy()
+        trail[1:] &= ~falling[:-1]
+        tx, ty = np.nonzero(trail.T)
+        order = np.lexsort((ly, lx))
+        ly, lx = ly[order], lx[order]
+
+        fy, fx = np.nonzero(falling)
+        moving = psub[fy, fx]
+        moving_types = tsub[fy, fx]
+        displaced = psub[ly + 1, lx]
+        displaced_types = tsub[ly + 1, lx]
+
+        psub[fy + 1, fx] = moving
+        tsub[fy + 1, fx] = moving_types
+        psub[ty, tx] = displaced
+        tsub[ty, tx] = displaced_types
+
+        if dy < 0:
+            psub, tsub = psub[::-1], tsub[::-1]
+            fy = height - 2 - fy
+            ty = height - 1 - ty
+        else:
+            fy = fy + 1
+        sim.pmap[:, cols] = psub
+        tgrid[:, cols] = tsub
+
+        parts = sim.particles
+        parts.y[moving - 1] = fy + sim.row_origin
+        swapped = displaced != 0
+        parts.y[displaced[swapped] - 1] = ty[swapped] + sim.row_origin
+
+        # Keep the chunks along the way awake, as apply_moves does
+        fx, tx = cols[fx], cols[tx]
+        sim.chunks.wake_cells(fx, fy - dy + sim.row_origin)
+        sim.chunks.wake_cells(fx, fy + sim.row_origin)
+        sim.chunks.wake_cells(tx, ty + sim.row_origin)
+
+        old_ys = ys
+        batch.refresh(parts)
+        return batch.ys != old_ys
+
+    def _move_pass(self, sim: 'PowderToySimulation', tgrid: np.ndarray,
+                   batch: ParticleBatch, dx: int, dy: int, parity: int, table: np.ndarray,
+                   blocked: Optional[Tuple[int, int]] = None,
+                   eligible: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Try to shift every batch particle on the given parity by (dx, dy).
+        With `blocked`, only particles that cannot enter the cell at that
+        offset are candidates (e.g. slide diagonally only when the way down
+        is shut). `eligible` optionally masks out particles altogether.
+        Returns the batch positions of the particles that moved.
+        """
+        height, width = tgrid.shape
+        xs, ys, types = batch.xs, batch.ys, batch.types
+        lane = ys if dy else xs
+
+        selected = (lane & 1) == parity
+        if eligible is not None:
+            selected &= eligible
+        candidates = np.flatnonzero(selected)
+        cx, cy = xs[candidates], ys[candidates]
+        nx, ny = cx + dx, cy + dy
+        inside = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+        if not inside.all():
+            candidates, cx, cy, nx, ny = (a[inside] for a in (candidates, cx, cy, nx, ny))
+        if candidates.size == 0:
+            return candidates
+        ctypes = types[candidates]
+
+        if blocked is not None:
+            bx, by = cx + blocked[0], cy + blocked[1]
+            inside = (bx >= 0) & (bx < width) & (by >= 0) & (by < height)
+            open_ = np.zeros(candidates.size, dtype=bool)
+            open_[inside] = table[ctypes[inside], tgrid[by[inside], bx[inside]]]
+            shut = ~open_
+            candidates, cx, cy, nx, ny, ctypes = (
+                a[shut] for a in (candidates, cx, cy, nx, ny, ctypes))
+
+        targets = tgrid[ny, nx]
+        enter = table[ctypes, targets]
+        movers = candidates[enter]
+        if movers.size == 0:
+            return movers
+
+        nx, ny = nx[enter], ny[enter]
+        apply_moves(sim, tgrid, cx[enter], cy[enter], nx, ny)
+        if (self.falldown_table[targets[enter]] == self.falldown).any():
+            # Swapped with particles of this batch: re-read every position
+            batch.refresh(sim.particles)
+        else:
+            xs[movers] = nx
+            ys[movers] = ny
+        return movers
+
+class PowderKernel(MovementKernel):
+    """
+    Powders (falldown=1): fall straight down, otherwise slide diagonally.
+    Sinks through lighter liquids and gases. Row parity and the preferred
+    diagonal alternate every frame, so piles build without a directional
+    bias.
+    """
+
+    falldown = 1
+
+    def step(self, sim, tgrid):
+        idx = self.select(sim)
+        if idx.size == 0:
+            return
+
+        parts = sim.particles
+        self._fall(sim, tgrid, ParticleBatch(parts, idx, sim.row_origin))
+
+        # Kernel-driven particles carry no momentum between frames
+        parts.vx[idx] = 0.0
+        parts.vy[idx] = 0.0
+
+class LiquidKernel(MovementKernel):
+    """
+    Liquids (falldown=2): fall and slide like powders, then flow sideways
+    (into empty cells or lighter fluids) while the way down stays shut. Each particle keeps its
+    flow direction in the sign of vx and reverses it when it cannot move,
+    so surfaces level out instead of random-walking. The two directions run
+    as separate passes, so flows never collide. Heavier liquids sink
+    through lighter ones by Element.weight (water under oil, lava under both).
+    """
+
+    falldown = 2
+    spread = 4  # Sideways passes per frame - how many cells a liquid can flow
+
+    def step(self, sim, tgrid):
+        idx = self.select(sim)
+        if idx.size == 0:
+            return
+
+        parts = sim.particles
+        batch = ParticleBatch(parts, idx, sim.row_origin)
+        self._fall(sim, tgrid, batch)
+
+        # Particles without a flow direction yet pick one at random
+        direction = np.sign(parts.vx[idx]).astype(np.int64)
+        unset = direction == 0
+        direction[unset] = np.where(sim.rng.random(int(unset.sum())) < 0.5, 1, -1)
+
+        flowed = np.zeros(idx.size, dtype=bool)
+        first = sim.frame_count & 1
+        for k in range(self.spread):
+            parity = (first + k) & 1
+            for dx in (1, -1):
+                moved = self._move_pass(sim, tgrid, batch, dx, 0, parity, self.sink_table,
+                                        blocked=(0, 1), eligible=direction == dx)
+                flowed[moved] = True
+
+        # Bounce off whatever stopped the flow this frame
+        direction[~flowed] *= -1
+        parts.vx[idx] = direction
+        parts.vy[idx] = 0.0
+
+class GasKernel(MovementKernel):
+    """
+    Gases (falldown=3): age and burn out after Element.lifetime frames,
+    rise in whole columns (slipping diagonally upwards when capped), and
+    take a random sideways step with probability Element.diffusion. Gases
+    only enter empty cells or swap with heavier gases.
+    """
+
+    falldown = 3
+
+    def __init__(self, props):
+        super().__init__(props)
+        self.lifetime = props.lifetime
+        self.diffusion = props.diffusion.astype(np.float64)
+
+        ntypes = len(self.weight)
+        empty = np.zeros(ntypes, dtype=bool)
+        empty[0] = True
+        gas = self.falldown_table == 3
+        heavier = self.weight[None, :] > self.weight[:, None]
+        self.rise_table = empty[None, :] | (gas[None, :] & heavier)
+
+    def prepare(self, sim, tgrid):
+        idx = self.select(sim)
+        if idx.size:
+            self._decay(sim, tgrid, idx)
+
+    def step(self, sim, tgrid):
+        idx = self.select(sim)
+        if idx.size == 0:
+            return
+
+        parts = sim.particles
+        batch = ParticleBatch(parts, idx, sim.row_origin)
+
+        first = sim.frame_count & 1
+        side = 1 if first else -1
+        for parity in (first, first ^ 1):
+            rose = self._column_shift(sim, tgrid, batch, self.rise_table, -1)
+            for dx in (side, -side):
+                self._move_pass(sim, tgrid, batch, dx, -1, parity, self.rise_table,
+                                blocked=(0, -1), eligible=~rose)
+
+        # Random sideways drift: each wandering particle picks a direction;
+        # both column parities run so every one of them gets a chance
+        wander = sim.rng.random(batch.size) < self.diffusion[batch.types]
+        direction = np.where(sim.rng.random(batch.size) < 0.5, 1, -1)
+        for dx in (1, -1):
+            waiting = wander & (direction == dx)
+            for parity in (0, 1):
+                moved = self._move_pass(sim, tgrid, batch, dx, 0, parity, self.rise_table,
+                                        eligible=waiting)
+                waiting[moved] = False
+
+        parts.vx[idx] = 0.0
+        parts.vy[idx] = 0.0
+
+    def _decay(self, sim, tgrid: np.ndarray, idx: np.ndarray):
+        """Age every gas particle and kill the burnt-out ones"""
+        parts = sim.particles
+        lifetime = self.lifetime[parts.type[idx]]
+        parts.life[idx] += 1
+        dead = (lifetime > 0) & (parts.life[idx] > lifetime)
+        if not dead.any():
+            return
+
+        dying = idx[dead]
+        tgrid[parts.y[dying].astype(np.int64), parts.x[dying].astype(np.int64)] = 0
+        sim.kill_particles(dying)
+
+class DriftKernel(MovementKernel):
+    """
+    Air drift: every movable particle with Element.advection is carried
+    along the air velocity of its cell (sim.vx / sim.vy) by up to one cell
+    per axis per frame. Fractional displacements move with matching
+    probability. Drifting particles only enter empty cells.
+    """
+
+    falldown = -1  # Not a falldown class: runs after them, over all of them
+
+    def __init__(self, props):
+        super().__init__(props)
+        self.advection = props.advection
+        self.movable = (self.advection > 0) & (self.falldown_table != 0)
+
+        ntypes = len(self.weight)
+        empty = np.zeros(ntypes, dtype=bool)
+        empty[0] = True
+        self.empty_table = np.broadcast_to(empty, (ntypes, ntypes))
+
+    def select(self, sim):
+        # Wind also reaches sleeping chunks: the moves it causes wake them
+        active = sim.active[:sim.parts_active]
+        chosen = self.movable[sim.particles.type[active]]
+        if sim.owned_rows is not None:
+            chosen &= self._owned(sim, active)
+        return self._ordered(sim, active[chosen])
+
+    def step(self, sim, tgrid):
+        if sim.air.is_still(sim):
+            return
+        idx = self.select(sim)
+        if idx.size == 0:
+            return
+
+        batch = ParticleBatch(sim.particles, idx, sim.row_origin)
+        cx, cy = sim.cell_coords(batch.xs, batch.ys + sim.row_origin)
+        advection = self.advection[batch.types]
+        for axis, air in ((0, sim.vx), (1, sim.vy)):
+            shift = air[cy, cx] * advection
+            drifting = sim.rng.random(batch.size) < np.abs(shift)
+            if not drifting.any():
+                continue
+            for step in (1, -1):
+                waiting = drifting & (np.sign(shift) == step)
+                dx, dy = (step, 0) if axis == 0 else (0, step)
+                for parity in (0, 1):
+                    moved = self._move_pass(sim, tgrid, batch, dx, dy, parity,
+                                            self.empty_table, eligible=waiting)
+                    waiting[moved] = False
+
+def build_kernels(props: 'ElementTable'):
+    """Instantiate the batched movement stages in execution order"""
+    return [PowderKernel(props), LiquidKernel(props), GasKernel(props), DriftKernel(props)]
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY PARALLEL UPDATE
+==========================
+
+Opt-in multi-process movement stage for PowderToySimulation's array
+storage (PowderToySimulation(storage='arrays', workers=N)). The particle
+fields, pmap, chunk map and air velocity live in shared memory, and the
+grid is split into horizontal bands that worker processes advance with the
+ordinary batched movement kernels.
+
+Bands run in two phases, even bands first and odd bands second
+(red/black), so two neighbouring bands never run at the same time. Each
+worker sees its band plus HALO rows above and below it: particles leaving
+the band land in the halo rows, which belong to a neighbour that is idle
+during this phase, and the neighbour picks them up in its own phase.
+Lifetimes, the per-particle element updates, air and heat stay serial.
+
+License: GPL-3.0
+"""
+
+import atexit
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from powder_toy_engine import PARTICLE_FIELDS
+
+if TYPE_CHECKING:
+    from powder_toy_engine import PowderToySimulation
+
+# Rows of the neighbouring bands each worker may write. A particle moves at
+# most a few rows per frame (two column shifts plus sinking and sliding),
+# so this comfortably covers one frame of cross-band traffic.
+HALO = 8
+
+# =============================================================================
+# SHARED MEMORY
+# =============================================================================
+
+class SharedArena:
+    """
+    Allocates NumPy arrays in named shared memory blocks, with the same
+    (shape, dtype) signature as np.zeros, and describes them so worker
+    processes can attach to the same memory.
+    """
+
+    def __init__(self):
+        self.blocks = []  # (SharedMemory, array) pairs
+        atexit.register(self.close)
+
+    def zeros(self, shape, dtype) -> np.ndarray:
+        """Zero-filled shared array"""
+        dtype = np.dtype(dtype)
+        shape = tuple(np.atleast_1d(shape).tolist())
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        self.blocks.append((block, array))
+        return array
+
+    def describe(self, array: np.ndarray):
+        """(block name, shape, dtype) of an array from this arena"""
+        for block, owned in self.blocks:
+            if owned is array:
+                return block.name, array.shape, array.dtype.str
+        raise ValueError("Array was not allocated by this arena")
+
+    def close(self):
+        """Remove the shared blocks; the memory goes once nothing maps it"""
+        for block, _ in self.blocks:
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = []
+
+def attach(spec, blocks: list) -> np.ndarray:
+    """Map an array described by SharedArena.describe; keeps its block in `blocks`"""
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    blocks.append(block)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+# =============================================================================
+# WORKERS
+# =============================================================================
+
+class BandView:
+    """
+    What the movement kernels see of the simulation inside a worker:
+    pmap and the type grid are row windows of the shared grids, starting
+    at row_origin, and only particles in owned_rows are moved.
+    """
+
+    def __init__(self, arrays: dict, config: dict):
+        from powder_toy_air import AirSolver
+        from powder_toy_chunks import ChunkMap
+
+        self.XRES, self.YRES = config['XRES'], config['YRES']
+        self.CELL, self.XCELLS, self.YCELLS = config['CELL'], config['XCELLS'], config['YCELLS']
+        self.grid_pmap = arrays['pmap']
+        self.grid_tgrid = arrays['tgrid']
+        self.active = arrays['active']
+        self.slot_awake = arrays['slot_awake']
+        self.vx = arrays['vx']
+        self.vy = arrays['vy']
+        self.particles = ParticleFields(arrays['fields'])
+        self.chunks = ChunkMap(self.XRES, self.YRES)
+        self.chunks.quiet = arrays['quiet']
+        self.air = AirSolver(self.CELL)
+        self.deterministic = config['deterministic']
+        self.rng = None
+
+        self.parts_active = 0
+        self.frame_count = 0
+        self.row_origin = 0
+        self.owned_rows = None
+        self.pmap = self.tgrid = None
+
+    def enter(self, band, parts_active: int, frame_count: int, seed: int):
+        """
+        Point the view at one band for this frame. Its random generator is
+        derived from the seed, frame and band, so results do not depend on
+        which worker runs the band.
+        """
+        y0, y1 = band
+        self.rng = np.random.default_rng([seed, frame_count, y0])
+        top, bottom = max(y0 - HALO, 0), min(y1 + HALO, self.YRES)
+        self.row_origin = top
+        self.owned_rows = (y0, y1)
+        self.pmap = self.grid_pmap[top:bottom]
+        self.tgrid = self.grid_tgrid[top:bottom]
+        self.parts_active = parts_active
+        self.frame_count = frame_count
+
+    def cell_coords(self, x, y):
+        """Air grid cell (cx, cy) containing pixel (x, y)"""
+        return np.minimum(x // self.CELL, self.XCELLS - 1), np.minimum(y // self.CELL, self.YCELLS - 1)
+
+class ParticleFields:
+    """Attribute access to the shared particle field arrays (parts.x, parts.type, ...)"""
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+        for name, array in fields.items():
+            setattr(self, name, array)
+
+def _worker_main(conn, specs: dict, config: dict):
+    """Worker process: advance the bands it is told to, until told to stop"""
+    from powder_toy_elements import ElementTable, get_element_list
+    from powder_toy_kernels import build_kernels
+
+    blocks = []
+    arrays = {name: attach(spec, blocks) for name, spec in specs.items() if name != 'fields'}
+    arrays['fields'] = {name: attach(spec, blocks) for name, spec in specs['fields'].items()}
+    view = BandView(arrays, config)
+    kernels = build_kernels(ElementTable(get_element_list()))
+
+    while True:
+        message = conn.recv()
+        if message[0] == 'stop':
+            break
+        _, band, parts_active, frame_count, seed = message
+        try:
+            view.enter(band, parts_active, frame_count, seed)
+            for kernel in kernels:
+                kernel.step(view, view.tgrid)
+            conn.send(('done', None))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+# =============================================================================
+# PARALLEL UPDATER
+# =============================================================================
+
+class ParallelUpdater:
+    """
+    Runs the movement kernels of a PowderToySimulation in worker processes.
+    The grid is cut into 2 * workers bands of whole chunks (fewer on short
+    grids, since every band must be at least 2 * HALO rows tall); worker k
+    owns bands 2k (even phase) and 2k + 1 (odd phase).
+    """
+
+    def __init__(self, sim: 'PowderToySimulation', workers: int):
+        arena = sim._arena
+        self.tgrid = arena.zeros((sim.YRES, sim.XRES), np.int32)
+        specs = {
+            'pmap': arena.describe(sim.pmap),
+            'tgrid': arena.describe(self.tgrid),
+            'active': arena.describe(sim.active),
+            'slot_awake': arena.describe(sim.slot_awake),
+            'quiet': arena.describe(sim.chunks.quiet),
+            'vx': arena.describe(sim.vx),
+            'vy': arena.describe(sim.vy),
+            'fields': {name: arena.describe(sim.particles.fields[name])
+                       for name, _ in PARTICLE_FIELDS},
+        }
+        config = {'XRES': sim.XRES, 'YRES': sim.YRES, 'CELL': sim.CELL,
+                  'XCELLS': sim.XCELLS, 'YCELLS': sim.YCELLS,
+                  'deterministic': sim.deterministic}
+
+        self.bands = self.split_bands(sim.YRES, workers, sim.chunks.SIZE)
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.processes = []
+        for _ in range(len(self.bands) // 2):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child, specs, config),
+                                      daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        atexit.register(self.close)
+
+    @staticmethod
+    def split_bands(height: int, workers: int, align: int):
+        """Even number of [y0, y1) bands covering the rows, aligned to `align`"""
+        unit = -(-2 * HALO // align) * align  # Smallest aligned band height
+        count = max(min(2 * workers, height // unit) // 2 * 2, 2)
+        edges = [height * k // (count * align) * align for k in range(count)] + [height]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def step(self, sim: 'PowderToySimulation', tgrid: np.ndarray):
+        """Run every kernel over all bands, even bands first, then odd ones"""
+        self.tgrid[:] = tgrid
+        for phase in (0, 1):
+            for k, conn in enumerate(self.connections):
+                conn.send(('step', self.bands[2 * k + phase], sim.parts_active,
+                           sim.frame_count, sim.seed))
+            errors = [reply for reply in (conn.recv() for conn in self.connections)
+                      if reply[0] == 'error']
+            if errors:
+                raise RuntimeError(f"Parallel update failed:\n{errors[0][1]}")
+        tgrid[:] = self.tgrid
+
+    def close(self):
+        """Stop the workers"""
+        for conn in self.connections:
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.processes = []
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY REACTIONS
+====================
+
+Pairwise element interactions declared as data. A Reaction says that a
+particle of one element touching (8-neighbourhood) a particle of another
+turns into something else with some probability per frame, optionally
+changing the neighbour too and releasing heat. Salt dissolving in water
+is a rule here instead of code in an Element.update override.
+
+All rules are evaluated together once per frame by ReactionTable.step:
+one pass gathers the neighbourhood of every awake particle that appears
+as a reactant, then each rule is resolved with array operations, so
+adding elements or rules adds no per-particle Python work.
+
+License: GPL-3.0
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Optional, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from powder_toy_elements import ElementTable
+    from powder_toy_engine import PowderToySimulation
+
+# Neighbour offsets, in the order of the gathered neighbourhood columns
+OFFSETS_X = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+OFFSETS_Y = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+
+OUTSIDE = -1  # Neighbour type of cells beyond the grid edge
+
+# =============================================================================
+# RULES
+# =============================================================================
+
+@dataclass(frozen=True)
+class Reaction:
+    """
+    A `reactant` particle touching a `neighbour` particle becomes `product`
+    (PT_NONE: it disappears). The chance is `probability` per frame for
+    each touching neighbour. With `neighbour_product` set, one of the
+    touching neighbours becomes that at the same time.
+
+    Particles that change type start afresh (life 0) at their new element's
+    default temperature; `heat` is added to every product.
+    """
+    reactant: int
+    neighbour: int
+    probability: float
+    product: int
+    neighbour_product: Optional[int] = None
+    heat: float = 0.0
+
+# =============================================================================
+# EVALUATION
+# =============================================================================
+
+class ReactionTable:
+    """
+    The reaction rules of a simulation, evaluated in bulk. Rules see the
+    grid as it was at the start of the pass, and a particle takes part in
+    at most one reaction per frame (earlier rules win). Only particles in
+    awake chunks react; their neighbours may be asleep.
+    """
+
+    def __init__(self, props: 'ElementTable', reactions: Iterable[Reaction]):
+        self.reactions = list(reactions)
+        ntypes = len(props)
+        for r in self.reactions:
+            for element_type in (r.reactant, r.neighbour):
+                if not 0 < element_type < ntypes:
+                    raise ValueError(f"Reaction between unknown elements: {r}")
+            for element_type in (r.product, r.neighbour_product):
+                if element_type is not None and not 0 <= element_type < ntypes:
+                    raise ValueError(f"Reaction with an unknown product: {r}")
+            if not 0.0 <= r.probability <= 1.0:
+                raise ValueError(f"Reaction probability must be within 0-1: {r}")
+
+        self.default_temp = props.default_temp
+        self.is_reactant = np.zeros(ntypes, dtype=bool)
+        for r in self.reactions:
+            self.is_reactant[r.reactant] = True
+
+    def step(self, sim: 'PowderToySimulation', tgrid: np.ndarray):
+        """Run every rule once over the awake particles, keeping tgrid in sync"""
+        if not self.reactions:
+            return
+        ys, xs = np.nonzero(self.is_reactant[tgrid] & sim.chunks.cell_mask())
+        if ys.size == 0:
+            return
+
+        # One neighbourhood gather for all candidates: (candidates, 8) types
+        padded = np.pad(tgrid, 1, constant_values=OUTSIDE)
+        types = tgrid[ys, xs]
+        around = padded[ys[:, None] + 1 + OFFSETS_Y, xs[:, None] + 1 + OFFSETS_X]
+        changed = np.zeros(tgrid.shape, dtype=bool)  # Cells already reacted this frame
+
+        for r in self.reactions:
+            chosen = np.flatnonzero((types == r.reactant) & ~changed[ys, xs])
+            if chosen.size == 0:
+                continue
+            touching = around[chosen] == r.neighbour
+            count = touching.sum(axis=1)
+            has = count > 0
+            chosen, touching, count = chosen[has], touching[has], count[has]
+            if chosen.size == 0:
+                continue
+
+            # Independent chance per touching neighbour
+            chance = 1.0 - (1.0 - r.probability) ** count
+            fire = sim.rng.random(chosen.size) < chance
+            chosen, touching = chosen[fire], touching[fire]
+            if chosen.size == 0:
+                continue
+            rx, ry = xs[chosen], ys[chosen]
+
+            if r.neighbour_product is not None:
+                # Each reactant picks one touching neighbour at random; a
+                # neighbour is only used once, so later claims are dropped
+                pick = np.argmax(touching * sim.rng.random(touching.shape), axis=1)
+                nx, ny = rx + OFFSETS_X[pick], ry + OFFSETS_Y[pick]
+                free = ~changed[ny, nx]
+                _, first = np.unique(ny[free] * sim.XRES + nx[free], return_index=True)
+                keep = np.flatnonzero(free)[np.sort(first)]
+                rx, ry, nx, ny = rx[keep], ry[keep], nx[keep], ny[keep]
+                changed[ny, nx] = True
+                self._transform(sim, tgrid, nx, ny, r.neighbour, r.neighbour_product, r.heat)
+
+            changed[ry, rx] = True
+            self._transform(sim, tgrid, rx, ry, r.reactant, r.product, r.heat)
+
+    def _transform(self, sim: 'PowderToySimulation', tgrid: np.ndarray,
+                   xs: np.ndarray, ys: np.ndarray, old_type: int, new_type: int,
+                   heat: float):
+        """Turn the particles at (xs, ys), all of old_type, into new_type"""
+        if xs.size == 0:
+            return
+        slots = (sim.pmap[ys, xs] - 1).astype(np.int64)
+        tgrid[ys, xs] = new_type
+        if new_type == 0:
+            sim.kill_particles(slots)
+            return
+
+        sim.chunks.wake_cells(xs, ys)
+        if new_type == old_type:
+            temps = sim.gather_field('temp', slots) + heat
+        else:
+            temps = np.full(slots.size, self.default_temp[new_type] + heat, dtype=np.float32)
+            sim.scatter_field('type', slots, np.full(slots.size, new_type, dtype=np.int32))
+            sim.scatter_field('life', slots, np.zeros(slots.size, dtype=np.int32))
+        sim.scatter_field('temp', slots, temps)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY RENDERER
+===================
+
+Whole-frame renderer for PowderToySimulation. Instead of drawing one
+rectangle per particle, the frame's type grid is mapped through a
+per-element colour lookup table straight into a pygame pixel buffer
+(pygame.surfarray), which is then blitted once.
+
+Besides the plain colour view there are TPT-style display modes that
+colour pixels by particle temperature, air pressure or air velocity
+through precomputed colormaps, and an optional glow layer for emitters
+such as FIRE and LAVA.
+
+License: GPL-3.0
+"""
+
+import colorsys
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pygame
+
+from powder_toy_elements import Element
+
+if TYPE_CHECKING:
+    from powder_toy_engine import PowderToySimulation
+
+# =============================================================================
+# COLORMAPS
+# =============================================================================
+
+# Cold to hot, roughly following TPT's heat display
+HEAT_STOPS = [
+    (0.00, (0, 0, 96)),
+    (0.15, (0, 64, 255)),
+    (0.30, (0, 224, 224)),
+    (0.45, (0, 255, 64)),
+    (0.60, (255, 255, 0)),
+    (0.80, (255, 64, 0)),
+    (1.00, (255, 255, 255)),
+]
+
+# Negative pressure blue, positive red, still air black
+PRESSURE_STOPS = [
+    (0.0, (64, 96, 255)),
+    (0.5, (0, 0, 0)),
+    (1.0, (255, 64, 32)),
+]
+
+def gradient(stops, size: int = 256) -> np.ndarray:
+    """(size, 3) uint8 colormap interpolated linearly between (position, rgb) stops"""
+    positions = np.linspace(0.0, 1.0, size)
+    stop_at = [position for position, _ in stops]
+    channels = [np.interp(positions, stop_at, [color[c] for _, color in stops])
+                for c in range(3)]
+    return np.stack(channels, axis=1).round().astype(np.uint8)
+
+def direction_map(size: int = 33) -> np.ndarray:
+    """
+    (size, size, 3) uint8 colormap over (vy, vx) in [-1, 1]: hue gives the
+    direction of the flow, brightness its speed.
+    """
+    axis = np.linspace(-1.0, 1.0, size)
+    colors = np.zeros((size, size, 3), dtype=np.uint8)
+    for iy, vy in enumerate(axis):
+        for ix, vx in enumerate(axis):
+            hue = (np.arctan2(vy, vx) / (2 * np.pi)) % 1.0
+            value = min(np.hypot(vx, vy), 1.0)
+            colors[iy, ix] = [round(c * 255) for c in colorsys.hsv_to_rgb(hue, 1.0, value)]
+    return colors
+
+# =============================================================================
+# RENDERER
+# =============================================================================
+
+class GlowLayer:
+    """
+    Glow post-processing, like TPT's fire display. Glowing elements
+    (Element.glow) add their colour into a quarter-resolution RGB
+    intensity buffer, which is decayed and blurred every frame and added
+    over the particle frame at buffer resolution (each cell covers a
+    SCALE x SCALE block; the blur keeps neighbouring blocks close).
+    """
+
+    SCALE = 4          # Pixels per buffer cell along each axis
+    DECAY = 0.85       # Fraction of the glow kept each frame
+    FLOOR = 0.05       # Glow lost outright each frame, so faded glow reaches zero
+    INTENSITY = 0.03   # Share of an element's colour one pixel adds per frame
+
+    def __init__(self, sim: 'PowderToySimulation'):
+        self.width = -(-sim.XRES // self.SCALE)
+        self.height = -(-sim.YRES // self.SCALE)
+        self.buffer = np.zeros((3, self.height, self.width), dtype=np.float32)
+        self.blurred = np.zeros_like(self.buffer)  # Scratch for the blur
+
+        # Glowing element types, and the (3, types) colour each of their
+        # samples adds
+        glow = sim.props.glow
+        self.glowing = np.flatnonzero(glow > 0)
+        colors = sim.props.color[self.glowing].astype(np.float32)
+        self.colors = (colors * (glow[self.glowing] * self.INTENSITY * 4)[:, None]).T.copy()
+
+        # Emitters are sampled on every other pixel along each axis (each
+        # sample stands for a 2x2 block): buffer cell of every sample
+        rows = np.arange(0, sim.YRES, 2) // self.SCALE
+        cols = np.arange(0, sim.XRES, 2) // self.SCALE
+        self.sample_cells = (rows[:, None] * self.width + cols[None, :]).reshape(-1)
+
+        self.small = pygame.Surface((self.width, self.height))
+        self.large = pygame.Surface((sim.XRES, sim.YRES))
+
+    def clear(self):
+        """Drop all accumulated glow"""
+        self.buffer.fill(0.0)
+
+    def update(self, tgrid: np.ndarray):
+        """Decay, add this frame's emitters, then blur"""
+        buffer = self.buffer
+        # The floor also keeps faded glow from lingering as denormal
+        # floats, which make every later operation on the buffer slow
+        buffer *= self.DECAY
+        buffer -= self.FLOOR
+        np.maximum(buffer, 0.0, out=buffer)
+        if self.glowing.size == 0:
+            return
+
+        # Count the samples of each glowing type (there are few) per cell,
+        # then add every type's colour times its counts
+        sampled = np.ascontiguousarray(tgrid[::2, ::2]).reshape(-1)
+        size = self.width * self.height
+        cells = [self.sample_cells[np.flatnonzero(sampled == element_type)] + k * size
+                 for k, element_type in enumerate(self.glowing)]
+        counts = np.bincount(np.concatenate(cells), minlength=len(cells) * size)
+        counts = counts.astype(np.float32).reshape(len(cells), size)
+        buffer.reshape(3, size)[:] += self.colors @ counts
+
+        # Separable [1, 2, 1] / 4 blur, in place without temporaries; the
+        # outer cells lose glow to the edge
+        blurred = self.blurred
+        np.multiply(buffer, 2.0, out=blurred)
+        blurred[:, :, 1:] += buffer[:, :, :-1]
+        blurred[:, :, :-1] += buffer[:, :, 1:]
+        np.multiply(blurred, 2.0, out=buffer)
+        buffer[:, 1:, :] += blurred[:, :-1, :]
+        buffer[:, :-1, :] += blurred[:, 1:, :]
+        buffer *= 1.0 / 16.0
+
+    def blend(self, surface: pygame.Surface):
+        """Add the glow over a full-resolution frame"""
+        rgb = np.minimum(self.buffer, 255.0).astype(np.uint8)
+        pygame.surfarray.blit_array(self.small, rgb.transpose(2, 1, 0))
+        pygame.transform.scale(self.small, self.large.get_size(), self.large)
+        surface.blit(self.large, (0, 0), special_flags=pygame.BLEND_ADD)
+
+class SimulationRenderer:
+    """
+    Renders the particle grid into an XRES x YRES surface.
+    Elements that override Element.graphics() are still asked for their
+    colour per particle; every other element is a single LUT entry.
+    render() also accepts a FrameSnapshot (powder_toy_worker) in place of
+    the simulation; snapshots carry no particles, so custom graphics fall
+    back to the LUT colour.
+
+    Display modes (switch with set_mode / cycle_mode):
+    - normal: element colours
+    - heat: particles coloured by temperature
+    - pressure: air pressure (pv) behind the particles
+    - velocity: air velocity (vx, vy) behind the particles
+    """
+
+    MODES = ('normal', 'heat', 'pressure', 'velocity')
+
+    HEAT_RANGE = (0.0, 3500.0)  # Kelvin spanned by the heat colormap
+    PRESSURE_RANGE = 16.0       # |pv| at full colour
+    VELOCITY_RANGE = 2.0        # Air speed (pixels per frame) at full brightness
+
+    def __init__(self, sim: 'PowderToySimulation', background=(0, 0, 0)):
+        self.surface = pygame.Surface((sim.XRES, sim.YRES))
+        self.background = background
+        self.mode = 'normal'
+        self.glow = GlowLayer(sim)
+        self.glow_enabled = False
+
+        # Mapped pixel values in the surface's own format, indexed by type
+        colors = [element.color if element is not None else background
+                  for element in sim.elements]
+        colors[0] = background
+        self.lut = np.array([self.surface.map_rgb(color) for color in colors],
+                            dtype=np.uint32)
+
+        # Types whose colour depends on the particle
+        self.custom = [t for t, element in enumerate(sim.elements)
+                       if element is not None and t != 0
+                       and type(element).graphics is not Element.graphics]
+
+        # Colormaps, as mapped pixel values
+        self.heat_map = self._map_colors(gradient(HEAT_STOPS))
+        self.pressure_map = self._map_colors(gradient(PRESSURE_STOPS))
+        self.velocity_map = self._map_colors(direction_map())
+
+        # Air cell of every pixel row and column
+        self.cell_rows = np.minimum(np.arange(sim.YRES) // sim.CELL, sim.YCELLS - 1)
+        self.cell_cols = np.minimum(np.arange(sim.XRES) // sim.CELL, sim.XCELLS - 1)
+
+    def set_mode(self, mode: str):
+        """Switch the display mode"""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown display mode: {mode!r}")
+        self.mode = mode
+
+    def cycle_mode(self) -> str:
+        """Switch to the next display mode and return its name"""
+        self.mode = self.MODES[(self.MODES.index(self.mode) + 1) % len(self.MODES)]
+        return self.mode
+
+    def render(self, sim: 'PowderToySimulation', tgrid=None) -> pygame.Surface:
+        """Draw the current frame and return the surface"""
+        if tgrid is None:
+            tgrid = sim.type_grid()
+
+        if self.mode == 'heat':
+            pixels = self._heat_pixels(sim, tgrid)
+        else:
+            pixels = self._element_pixels(sim, tgrid)
+            if self.mode == 'pressure':
+                self._air_behind(pixels, tgrid, self._pressure_cells(sim))
+            elif self.mode == 'velocity':
+                self._air_behind(pixels, tgrid, self._velocity_cells(sim))
+
+        # surfarray is indexed [x, y], the simulation grids [y, x]
+        pygame.surfarray.blit_array(self.surface, pixels.T)
+
+        if self.glow_enabled:
+            self.glow.update(tgrid)
+            self.glow.blend(self.surface)
+        return self.surface
+
+    def toggle_glow(self) -> bool:
+        """Switch the glow layer on or off; returns the new state"""
+        self.glow_enabled = not self.glow_enabled
+        if not self.glow_enabled:
+            self.glow.clear()
+        return self.glow_enabled
+
+    def _map_colors(self, colors: np.ndarray) -> np.ndarray:
+        """Turn an (..., 3) uint8 colormap into mapped pixel values"""
+        flat = colors.reshape(-1, 3)
+        mapped = np.array([self.surface.map_rgb(tuple(int(c) for c in rgb)) for rgb in flat],
+                          dtype=np.uint32)
+        return mapped.reshape(colors.shape[:-1])
+
+    def _element_pixels(self, sim: 'PowderToySimulation', tgrid: np.ndarray) -> np.ndarray:
+        """Element colours of every pixel"""
+        pixels = self.lut[tgrid]
+        if sim.particles is None:
+            return pixels
+        for t in self.custom:
+            self._custom_graphics(sim, tgrid, t, pixels)
+        return pixels
+
+    def _heat_pixels(self, sim: 'PowderToySimulation', tgrid: np.ndarray) -> np.ndarray:
+        """Particles coloured by temperature over the background"""
+        low, high = self.HEAT_RANGE
+        size = len(self.heat_map)
+        index = (sim.field_grid('temp') - low) * ((size - 1) / (high - low))
+        pixels = self.heat_map[np.clip(index, 0, size - 1).astype(np.intp)]
+        np.copyto(pixels, self.lut[0], where=tgrid == 0)
+        return pixels
+
+    def _pressure_cells(self, sim: 'PowderToySimulation') -> np.ndarray:
+        """Pressure colour of every air cell"""
+        size = len(self.pressure_map)
+        index = (sim.pv * (0.5 / self.PRESSURE_RANGE) + 0.5) * (size - 1)
+        return self.pressure_map[np.clip(index, 0, size - 1).astype(np.intp)]
+
+    def _velocity_cells(self, sim: 'PowderToySimulation') -> np.ndarray:
+        """Velocity colour of every air cell"""
+        size = self.velocity_map.shape[0]
+        scale = 0.5 / self.VELOCITY_RANGE
+        ix = np.clip((sim.vx * scale + 0.5) * (size - 1) + 0.5, 0, size - 1).astype(np.intp)
+        iy = np.clip((sim.vy * scale + 0.5) * (size - 1) + 0.5, 0, size - 1).astype(np.intp)
+        return self.velocity_map[iy, ix]
+
+    def _air_behind(self, pixels: np.ndarray, tgrid: np.ndarray, cells: np.ndarray):
+        """Fill the empty pixels with the air colour of their cell"""
+        air = cells[self.cell_rows[:, None], self.cell_cols[None, :]]
+        np.copyto(pixels, air, where=tgrid == 0)
+
+    def _custom_graphics(self, sim: 'PowderToySimulation', tgrid: np.ndarray,
+                         element_type: int, pixels: np.ndarray):
+        """Per-particle colours for one element that overrides graphics()"""
+        ys, xs = np.nonzero(tgrid == element_type)
+        if ys.size == 0:
+            return
+        element = sim.elements[element_type]
+        slots = sim.pmap[ys, xs] - 1
+        pixels[ys, xs] = [self.surface.map_rgb(element.graphics(sim, sim.particles[i]))
+                          for i in slots.tolist()]
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY INPUT RECORDING AND REPLAY
+=====================================
+
+Records what a user does in the demo - brush strokes, clearing, loading
+saves, element selection, pausing and speed changes - tagged with the
+simulation step it took effect on, in a compact binary log. The headless
+replayer feeds a log back into a fresh PowderToySimulation with the same
+seed and settings, and reports how long every step took, so a slow
+session from the field becomes a repeatable benchmark.
+
+Only actions that change the simulation matter for the replay; the
+selection, pause and speed events are kept for the report.
+
+Log layout (little-endian):
+    header      HEADER (magic, version, seed, grid size, particle limit,
+                storage, flags)
+    events      EVENT (step, event code, payload size) + payload
+                (int32 arguments, or a UTF-8 path for 'load')
+    end         an 'end' event at the final step count
+
+Usage:
+    python powder_toy_replay.py session.ptlog [--storage objects|arrays]
+                                              [--workers N] [--output report.json]
+
+License: GPL-3.0
+"""
+
+import argparse
+import hashlib
+import json
+import struct
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from powder_toy_brush import BRUSH_SHAPES, draw_stroke
+from powder_toy_engine import PowderToySimulation
+
+MAGIC = b'PTLG'
+FORMAT_VERSION = 2
+
+# magic, version, seed, xres, yres, npart, storage mode index, flags
+HEADER = struct.Struct('<4sHQIIIBB')
+FLAG_DETERMINISTIC = 1
+
+# step, event code, payload size
+EVENT = struct.Struct('<IBH')
+
+# =============================================================================
+# ACTIONS
+# =============================================================================
+
+def _stroke(sim, x0, y0, x1, y1, element, size, shape):
+    draw_stroke(sim, x0, y0, x1, y1, element, size, BRUSH_SHAPES[shape])
+
+def _clear(sim):
+    sim.clear_sim()
+
+def _load(sim, path):
+    try:
+        sim.load(path)
+    except (OSError, ValueError) as exc:
+        # Same outcome live and in a replay: the simulation is unchanged
+        print(f"Could not load {path}: {exc}")
+
+def _note(sim, *args):
+    """UI-only events: nothing happens to the simulation"""
+
+# Input actions by name: (event code, function(sim, *args)). Brush shapes
+# are passed as indices into BRUSH_SHAPES so every argument is an int.
+ACTIONS = {
+    'stroke': (1, _stroke),
+    'clear': (2, _clear),
+    'load': (3, _load),
+    'select': (4, _note),
+    'pause': (5, _note),
+    'speed': (6, _note),
+}
+END = 7
+EVENT_NAMES = {code: name for name, (code, _) in ACTIONS.items()}
+EVENT_NAMES[END] = 'end'
+
+# =============================================================================
+# RECORDING
+# =============================================================================
+
+class InputRecorder:
+    """Appends input events to a log file as they are applied"""
+
+    def __init__(self, path: str, sim: 'PowderToySimulation'):
+        self.file = open(path, 'wb')
+        flags = FLAG_DETERMINISTIC if sim.deterministic else 0
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, sim.seed, sim.XRES, sim.YRES,
+                                    sim.NPART, sim.STORAGE_MODES.index(sim.storage), flags))
+
+    def record(self, step: int, action: str, args: tuple):
+        """Log one action taken at the start of `step`"""
+        code = ACTIONS[action][0]
+        if action == 'load':
+            payload = args[0].encode('utf-8')
+        else:
+            payload = struct.pack(f'<{len(args)}i', *(int(a) for a in args))
+        self.file.write(EVENT.pack(step, code, len(payload)))
+        self.file.write(payload)
+
+    def close(self, step: int):
+        """Mark the end of the session after `step` steps and close the log"""
+        if self.file.closed:
+            return
+        self.file.write(EVENT.pack(step, END, 0))
+        self.file.close()
+
+def read_log(path: str) -> Tuple[dict, List[Tuple[int, str, tuple]]]:
+    """Header fields and (step, action, args) events of a log file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"Not an input log (too short): {path}")
+    magic, version, seed, xres, yres, npart, storage, flags = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Not an input log: {path}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported input log version: {version}")
+    header = {
+        'seed': seed,
+        'grid': (xres, yres),
+        'npart': npart,
+        'storage': PowderToySimulation.STORAGE_MODES[storage],
+        'deterministic': bool(flags & FLAG_DETERMINISTIC),
+    }
+
+    events = []
+    offset = HEADER.size
+    while offset + EVENT.size <= len(data):
+        step, code, size = EVENT.unpack_from(data, offset)
+        offset += EVENT.size
+        payload = data[offset:offset + size]
+        offset += size
+        if code not in EVENT_NAMES:
+            raise ValueError(f"Unknown event code {code} in input log: {path}")
+        name = EVENT_NAMES[code]
+        if name == 'load':
+            args = (payload.decode('utf-8'),)
+        else:
+            args = struct.unpack(f'<{size // 4}i', payload)
+        events.append((step, name, args))
+    return header, events
+
+# =============================================================================
+# REPLAY
+# =============================================================================
+
+def replay(path: str, storage: str = None, workers: int = 0,
+           sim_class=PowderToySimulation) -> dict:
+    """
+    Replay a log on a fresh simulation of the recorded size and return the
+    timing report. The storage mode defaults to the recorded one; results
+    only match the session exactly in that mode.
+    """
+    header, events = read_log(path)
+    xres, yres = header['grid']
+    sim = sim_class(storage=storage or header['storage'], workers=workers,
+                    seed=header['seed'], deterministic=header['deterministic'],
+                    xres=xres, yres=yres, npart=header['npart'])
+    try:
+        # Sessions closed without an end event run up to their last input
+        end = max((step for step, _, _ in events), default=0)
+
+        step_times = np.zeros(end)
+        counts = dict.fromkeys(ACTIONS, 0)
+        pending = iter(events)
+        event = next(pending, None)
+        for step in range(end + 1):
+            while event is not None and event[0] == step:
+                _, name, args = event
+                if name != 'end':
+                    counts[name] += 1
+                    ACTIONS[name][1](sim, *args)
+                event = next(pending, None)
+            if step == end:
+                break
+            start = time.perf_counter()
+            sim.update_particles()
+            step_times[step] = time.perf_counter() - start
+
+        digest = hashlib.sha1(sim.type_grid().tobytes()).hexdigest()
+        particles = sim.parts_active
+    finally:
+        sim.close()
+
+    ms = step_times * 1000.0
+    slowest = np.argsort(ms)[::-1][:10]
+    return {
+        'log': path,
+        'storage': storage or header['storage'],
+        'seed': header['seed'],
+        'grid': list(header['grid']),
+        'npart': header['npart'],
+        'steps': int(end),
+        'events': counts,
+        'particles_end': particles,
+        'type_grid_sha1': digest,
+        'total_s': float(step_times.sum()),
+        'ms_per_step': {
+            'mean': float(ms.mean()) if end else 0.0,
+            'p50': float(np.percentile(ms, 50)) if end else 0.0,
+            'p95': float(np.percentile(ms, 95)) if end else 0.0,
+            'max': float(ms.max()) if end else 0.0,
+        },
+        'slowest_steps': [[int(step), float(ms[step])] for step in slowest],
+        'step_ms': ms.round(3).tolist(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a Powder Toy input log headless")
+    parser.add_argument('log', help="input log recorded with powder_toy_demo.py --record")
+    parser.add_argument('--storage', choices=PowderToySimulation.STORAGE_MODES,
+                        help="particle storage (default: as recorded)")
+    parser.add_argument('--workers', type=int, default=0, help="parallel movement workers")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = replay(args.log, storage=args.storage, workers=args.workers)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
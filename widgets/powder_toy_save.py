@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY SNAPSHOTS
+====================
+
+Compact binary save files for PowderToySimulation. A snapshot holds a
+fixed header, the element table it was written with, the state of the
+random generators, the live particles packed into slots 0..count-1 (one
+array per particle field), the pmap, the air grids and the sleeping-chunk
+counters. In deterministic mode a resumed run continues exactly like the
+original; in objects storage that holds as far as the particles' float
+values survive being stored as float32.
+
+Every array sits at a 64-byte aligned offset, so open_snapshot() maps
+the file with np.memmap instead of reading it: opening is instant and
+pages are only read when an array is used. Saving copies the state on
+the calling thread (cheap array copies) and can write the file on a
+background thread.
+
+Layout (little-endian):
+    header          HEADER (magic, format version, sizes, frame, seed,
+                    generator state size)
+    element table   n_elements identifiers, IDENT_SIZE bytes each
+    generators      JSON: sim.random.getstate() and sim.rng's bit
+                    generator state
+    particles       count values per PARTICLE_FIELDS entry, in order
+    pmap            (yres, xres) int32, packed slot + 1 (0 = empty)
+    air             vx, vy, pv, hv as (ycells, xcells) float32
+    chunks          ChunkMap.quiet, (rows, cols) int32
+
+License: GPL-3.0
+"""
+
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+
+from powder_toy_chunks import ChunkMap
+from powder_toy_engine import PARTICLE_FIELDS
+
+if TYPE_CHECKING:
+    from powder_toy_engine import PowderToySimulation
+
+MAGIC = b'PTSV'
+FORMAT_VERSION = 2
+
+# magic, format version, element count, element table version (CRC32 of
+# the identifiers), xres, yres, xcells, ycells, particle count,
+# frame count, seed, generator state size
+HEADER = struct.Struct('<4sHHIIIIIIQQI')
+
+IDENT_SIZE = 16  # Bytes per element identifier (UTF-8, zero padded)
+ALIGN = 64       # Alignment of every array section
+
+AIR_GRIDS = ('vx', 'vy', 'pv', 'hv')
+
+# =============================================================================
+# FORMAT
+# =============================================================================
+
+def element_identifiers(elements) -> List[str]:
+    """Identifier of every element ID ('' for unused IDs)"""
+    return [e.identifier if e is not None else '' for e in elements]
+
+def element_table_version(identifiers: List[str]) -> int:
+    """Checksum that changes whenever an element is added, removed or renumbered"""
+    return zlib.crc32('\0'.join(identifiers).encode('utf-8'))
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+def _layout(count: int, xres: int, yres: int, xcells: int, ycells: int,
+            n_elements: int, state_size: int):
+    """
+    (section, dtype, shape, offset) of every array section, and the file
+    size. Sections are named 'part.<field>', 'pmap', 'air.<grid>' and
+    'chunks'.
+    """
+    sections = [(f'part.{name}', np.dtype(dtype), (count,)) for name, dtype in PARTICLE_FIELDS]
+    sections.append(('pmap', np.dtype(np.int32), (yres, xres)))
+    sections += [(f'air.{name}', np.dtype(np.float32), (ycells, xcells)) for name in AIR_GRIDS]
+    sections.append(('chunks', np.dtype(np.int32),
+                     (-(-yres // ChunkMap.SIZE), -(-xres // ChunkMap.SIZE))))
+
+    offset = HEADER.size + n_elements * IDENT_SIZE + state_size
+    layout = []
+    for name, dtype, shape in sections:
+        offset = _align(offset)
+        layout.append((name, dtype, shape, offset))
+        offset += int(np.prod(shape)) * dtype.itemsize
+    return layout, offset
+
+class Snapshot:
+    """
+    Contents of a snapshot. Arrays are np.memmap views (read-only) when the
+    snapshot was opened from a file, plain copies when it was captured.
+    """
+
+    def __init__(self, xres: int, yres: int, xcells: int, ycells: int,
+                 frame_count: int, seed: int, identifiers: List[str],
+                 generators: dict, fields: Dict[str, np.ndarray], pmap: np.ndarray,
+                 air: Dict[str, np.ndarray], chunks: np.ndarray):
+        self.xres, self.yres = xres, yres
+        self.xcells, self.ycells = xcells, ycells
+        self.frame_count = frame_count
+        self.seed = seed
+        self.identifiers = identifiers
+        self.generators = generators  # {'random': getstate() as lists, 'rng': bit generator state}
+        self.fields = fields  # Packed particle fields, slots 0..count-1
+        self.pmap = pmap
+        self.air = air
+        self.chunks = chunks  # ChunkMap.quiet
+
+    @property
+    def count(self) -> int:
+        """Number of particles"""
+        return len(self.fields['type'])
+
+    def type_remap(self, identifiers: List[str]) -> np.ndarray:
+        """
+        Saved element ID -> current element ID, matching elements by
+        identifier. Raises ValueError if the save uses an unknown element.
+        """
+        current = {name: i for i, name in enumerate(identifiers) if name}
+        remap = np.zeros(len(self.identifiers), dtype=np.int32)
+        for i, name in enumerate(self.identifiers):
+            if not name:
+                continue
+            if name not in current:
+                raise ValueError(f"Snapshot uses an unknown element: {name!r}")
+            remap[i] = current[name]
+        return remap
+
+def capture_snapshot(sim: 'PowderToySimulation') -> Snapshot:
+    """Copy the simulation's state, with the live particles packed in slot order"""
+    live = np.sort(sim.active[:sim.parts_active]).astype(np.int64)
+    fields = {name: sim.gather_field(name, live) for name, _ in PARTICLE_FIELDS}
+
+    # Re-number pmap for the packed slots (same encoding: slot + 1)
+    remap = np.zeros(sim.NPART + 1, dtype=np.int32)
+    remap[live + 1] = np.arange(1, live.size + 1, dtype=np.int32)
+    pmap = remap[sim.pmap]
+
+    # Sub-pixel positions may round up into the next cell as float32: keep
+    # every particle inside the cell pmap puts it in
+    ys, xs = np.nonzero(pmap)
+    packed = pmap[ys, xs] - 1
+    for name, cells in (('x', xs), ('y', ys)):
+        low = cells.astype(np.float32)
+        high = np.nextafter(low + 1, low)
+        fields[name][packed] = np.clip(fields[name][packed], low, high)
+
+    air = {name: getattr(sim, name).copy() for name in AIR_GRIDS}
+    generators = {'random': sim.random.getstate(), 'rng': sim.rng.bit_generator.state}
+    return Snapshot(sim.XRES, sim.YRES, sim.XCELLS, sim.YCELLS, sim.frame_count,
+                    sim.seed, element_identifiers(sim.elements), generators,
+                    fields, pmap, air, sim.chunks.quiet.copy())
+
+def write_snapshot(snapshot: Snapshot, path: str):
+    """Write a snapshot file; written to a temporary name first, then renamed"""
+    identifiers = snapshot.identifiers
+    state = json.dumps(snapshot.generators).encode('utf-8')
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(identifiers),
+                         element_table_version(identifiers),
+                         snapshot.xres, snapshot.yres, snapshot.xcells, snapshot.ycells,
+                         snapshot.count, snapshot.frame_count, snapshot.seed, len(state))
+    table = b''.join(name.encode('utf-8')[:IDENT_SIZE].ljust(IDENT_SIZE, b'\0')
+                     for name in identifiers)
+    layout, size = _layout(snapshot.count, snapshot.xres, snapshot.yres,
+                           snapshot.xcells, snapshot.ycells, len(identifiers), len(state))
+    arrays = {'pmap': snapshot.pmap, 'chunks': snapshot.chunks}
+    arrays.update((f'part.{name}', array) for name, array in snapshot.fields.items())
+    arrays.update((f'air.{name}', grid) for name, grid in snapshot.air.items())
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(table)
+        f.write(state)
+        for name, dtype, shape, offset in layout:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype.newbyteorder('<')).tobytes())
+        f.truncate(size)
+    os.replace(temp_path, path)
+
+def open_snapshot(path: str) -> Snapshot:
+    """Map a snapshot file; the arrays are read lazily from the file"""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"Not a snapshot file (too short): {path}")
+        (magic, version, n_elements, table_version, xres, yres, xcells, ycells,
+         count, frame_count, seed, state_size) = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"Not a snapshot file: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {version}")
+        table = f.read(n_elements * IDENT_SIZE)
+        state = f.read(state_size)
+
+    identifiers = [table[i:i + IDENT_SIZE].rstrip(b'\0').decode('utf-8')
+                   for i in range(0, len(table), IDENT_SIZE)]
+    if element_table_version(identifiers) != table_version:
+        raise ValueError(f"Corrupt element table in snapshot: {path}")
+    try:
+        generators = json.loads(state.decode('utf-8'))
+    except ValueError:
+        raise ValueError(f"Corrupt generator state in snapshot: {path}") from None
+
+    layout, size = _layout(count, xres, yres, xcells, ycells, n_elements, state_size)
+    if os.path.getsize(path) < size:
+        raise ValueError(f"Truncated snapshot file: {path}")
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, dtype, shape, offset in layout:
+        length = int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = mapped[offset:offset + length].view(dtype.newbyteorder('<')).reshape(shape)
+
+    fields = {name: arrays[f'part.{name}'] for name, _ in PARTICLE_FIELDS}
+    air = {name: arrays[f'air.{name}'] for name in AIR_GRIDS}
+    return Snapshot(xres, yres, xcells, ycells, frame_count, seed, identifiers,
+                    generators, fields, arrays['pmap'], air, arrays['chunks'])
+
+# =============================================================================
+# BACKGROUND SAVING
+# =============================================================================
+
+_writer = None  # Single background writer thread, started on first use
+
+def save_snapshot(sim: 'PowderToySimulation', path: str, background: bool = False):
+    """
+    Save the simulation to `path`. The state is captured immediately; with
+    background=True the file is written on a writer thread and a Future is
+    returned (its result() re-raises any write error).
+    """
+    global _writer
+    snapshot = capture_snapshot(sim)
+    if not background:
+        write_snapshot(snapshot, path)
+        return None
+    if _writer is None:
+        _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='powder-toy-save')
+    future: Future = _writer.submit(write_snapshot, snapshot, path)
+    return future
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+POWDER TOY SIMULATION WORKER
+============================
+
+Runs a PowderToySimulation on a background thread, decoupled from the
+render loop. The worker advances the simulation at its own tick rate and
+publishes each completed frame as a FrameSnapshot through a triple buffer;
+the render loop picks up the newest snapshot without waiting. Input that
+changes the simulation (brush strokes, clearing) is queued as commands and
+applied by the worker between frames.
+
+The requested speed (steps per tick) is scheduled against a time budget per
+tick: the worker takes as many of the owed steps as its measured step cost
+fits into the budget and carries the rest forward, so a heavy scene at a
+high speed runs slower than asked instead of stalling the display.
+
+License: GPL-3.0
+"""
+
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from powder_toy_engine import PowderToySimulation
+
+SMOOTHING = 0.1           # Weight of the newest sample in step cost and speed averages
+MAX_BACKLOG_TICKS = 30    # Owed steps beyond this many ticks' worth are dropped
+
+# =============================================================================
+# FRAME HAND-OFF
+# =============================================================================
+
+class FrameSnapshot:
+    """
+    Copy of what the renderer reads from one simulation frame. Offers the
+    same grid queries and air grids as PowderToySimulation, so
+    SimulationRenderer.render accepts it in place of the live simulation.
+    Particles are not copied (particles is None): elements with a custom
+    graphics() are drawn in their plain colour.
+    """
+
+    def __init__(self, sim: 'PowderToySimulation'):
+        self.XRES, self.YRES, self.NPART = sim.XRES, sim.YRES, sim.NPART
+        self.elements = sim.elements
+        self.props = sim.props
+        self.particles = None
+        self.tgrid = np.zeros((sim.YRES, sim.XRES), dtype=np.int32)
+        self.temp = np.zeros((sim.YRES, sim.XRES), dtype=np.float32)
+        self.pv = np.zeros_like(sim.pv)
+        self.vx = np.zeros_like(sim.vx)
+        self.vy = np.zeros_like(sim.vy)
+        self.frame_count = 0
+        self.parts_active = 0
+
+    def capture(self, sim: 'PowderToySimulation', temp: bool = False):
+        """Copy the current frame; the temperature grid only when asked for"""
+        np.copyto(self.tgrid, sim.type_grid())
+        if temp:
+            np.copyto(self.temp, sim.field_grid('temp'))
+        np.copyto(self.pv, sim.pv)
+        np.copyto(self.vx, sim.vx)
+        np.copyto(self.vy, sim.vy)
+        self.frame_count = sim.frame_count
+        self.parts_active = sim.parts_active
+
+    def type_grid(self) -> np.ndarray:
+        """Element type of every cell (0 = empty)"""
+        return self.tgrid
+
+    def field_grid(self, name: str) -> np.ndarray:
+        """Captured per-cell field: 'type' or 'temp'"""
+        if name == 'type':
+            return self.tgrid
+        if name == 'temp':
+            return self.temp
+        raise ValueError(f"Field not captured in frame snapshots: {name!r}")
+
+class TripleBuffer:
+    """
+    Hands the newest of a stream of buffers from one writer thread to one
+    reader thread. The writer fills `back` and publish()es it; the reader
+    read()s `front`, which is swapped for the newest published buffer if
+    there is one. The two sides never hold the same buffer, and only wait
+    for each other during a swap.
+    """
+
+    def __init__(self, buffers):
+        self.front, self.middle, self.back = buffers
+        self._fresh = False  # middle holds a frame the reader has not seen
+        self._lock = threading.Lock()
+
+    def publish(self):
+        """Writer: make `back` the newest frame and take a free buffer"""
+        with self._lock:
+            self.back, self.middle = self.middle, self.back
+            self._fresh = True
+
+    def read(self):
+        """Reader: the newest published buffer (the last one if nothing new)"""
+        with self._lock:
+            if self._fresh:
+                self.front, self.middle = self.middle, self.front
+                self._fresh = False
+        return self.front
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+class SimulationWorker:
+    """
+    Background thread owning a PowderToySimulation. Every tick it applies
+    the queued commands, advances up to steps_per_tick frames plus the
+    backlog within frame_budget (unless paused) and publishes a snapshot.
+    At least one step is taken per tick, however slow. Once started,
+    anything that changes the simulation must go through submit() or
+    perform() so it runs on the worker thread.
+    Actions queued with perform() are logged to `recorder` when applied.
+    """
+
+    def __init__(self, sim: 'PowderToySimulation', tick_rate: float = 60.0,
+                 frame_budget: Optional[float] = None):
+        self.sim = sim
+        self.tick_rate = tick_rate  # Ticks per second
+        self.steps_per_tick = 1     # Requested speed
+        # Seconds of simulation per tick; by default half the tick, leaving
+        # the rest of it to the render loop
+        self.frame_budget = 0.5 / tick_rate if frame_budget is None else frame_budget
+        self.paused = False
+        self.capture_temp = False  # Snapshots include temperatures (heat display)
+        self.step_time = 0.0       # Seconds spent simulating in the last tick
+        self.step_cost = 0.0       # Average seconds per step
+        self.backlog = 0           # Owed steps that did not fit in earlier ticks
+        self.achieved_speed = 0.0  # Average steps per 1/tick_rate seconds, as run
+        self._last_tick = None
+        self.error = None          # Exception that stopped the thread, if any
+        self.step_count = 0        # Steps taken so far; clear_sim does not reset it
+        self.recorder = None       # InputRecorder for performed actions (powder_toy_replay)
+
+        self.frames = TripleBuffer([FrameSnapshot(sim) for _ in range(3)])
+        self.commands = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start ticking on the background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='powder-toy-sim', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread after its current tick"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, command, *args):
+        """Queue command(*args) to run on the simulation before the next step"""
+        self.commands.put((command, args, None))
+
+    def perform(self, action: str, *args):
+        """Queue a named input action (see powder_toy_replay.ACTIONS); recordable"""
+        from powder_toy_replay import ACTIONS
+        self.commands.put((ACTIONS[action][1], (self.sim,) + args, (action, args)))
+
+    def latest(self) -> FrameSnapshot:
+        """Newest completed frame; never waits for the simulation"""
+        if self.error is not None:
+            raise RuntimeError("Simulation worker stopped") from self.error
+        return self.frames.read()
+
+    def tick(self):
+        """One tick: commands, simulation steps, publish. Callable without the thread."""
+        self._apply_commands()
+        if self.paused:
+            # Nothing is owed for the time spent paused
+            taken, self.step_time, self.backlog = 0, 0.0, 0
+        else:
+            taken = self._run_steps()
+        # Measured against wall time, so ticks running late count too
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            speed = taken / ((now - self._last_tick) * self.tick_rate)
+            self.achieved_speed += SMOOTHING * (speed - self.achieved_speed)
+        self._last_tick = now
+        self.frames.back.capture(self.sim, self.capture_temp)
+        self.frames.publish()
+
+    def _run_steps(self) -> int:
+        """Take the owed steps that fit in the frame budget; returns the count"""
+        owed = self.backlog + self.steps_per_tick
+        taken = 0
+        elapsed = 0.0
+        # Stop before a step that is expected to overrun the budget
+        while taken < owed and (taken == 0 or elapsed + self.step_cost <= self.frame_budget):
+            start = time.perf_counter()
+            self.sim.update_particles()
+            cost = time.perf_counter() - start
+            if self.step_cost:
+                self.step_cost += SMOOTHING * (cost - self.step_cost)
+            else:
+                self.step_cost = cost
+            elapsed += cost
+            taken += 1
+            self.step_count += 1
+        self.step_time = elapsed
+        self.backlog = min(owed - taken, self.steps_per_tick * MAX_BACKLOG_TICKS)
+        return taken
+
+    def _apply_commands(self):
+        """Run every queued command in submission order"""
+        while True:
+            try:
+                command, args, action = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if action is not None and self.recorder is not None:
+                self.recorder.record(self.step_count, *action)
+            command(*args)
+
+    def _run(self):
+        """Thread body: tick at tick_rate, without catching up after slow ticks"""
+        deadline = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                deadline += 1.0 / self.tick_rate
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+                else:
+                    deadline = time.perf_counter()
+        except Exception as exc:
+            self.error = exc